@@ -1,11 +1,15 @@
+import asyncio
 import logging
 
-from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, WebSocketException, Depends
-from app.manager import game_manager
-from app.models import JoinRequest, JoinResponse, CreateGameResponse, Game
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect, WebSocketException, Depends
+from fastapi.responses import Response
+from app.manager import game_manager, TooManyGamesError
+from app.models import JoinRequest, JoinResponse, CreateGameResponse, Game, Player, ActionRequest
 from app.utils.jwt import create_token
-from app.utils.util import ensure_raft_leader, ensure_player_in_game
-from app.auth import get_current_player
+from app.utils.util import ensure_player_in_game, ensure_consistent_read, group_node, group_nodes
+from app.utils.proxy import forward_to_leader, forward_action, FORWARDED_HEADER, NOT_LEADER_HEADER
+from app.raftnode import NotLeaderError
+from app.auth import get_current_player, get_request_player
 from app.ws import ws_manager
 from app.ws_error_codes import WebSocketError
 
@@ -15,84 +19,164 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.post("/game")
-async def create_game() -> CreateGameResponse:   
-    game = await game_manager.create_game()
+async def create_game(http_request: Request) -> CreateGameResponse:   
+    forwarded = await forward_to_leader(http_request, group_nodes(http_request.app))
+    if forwarded is not None:
+        return forwarded
+    try:
+        game = await game_manager.create_game()
+    except (NotLeaderError, TooManyGamesError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
     return CreateGameResponse(code=game.code)
 
 
 @router.post("/game/join")
-async def join_game(request: JoinRequest) -> JoinResponse:
+async def join_game(request: JoinRequest, http_request: Request) -> JoinResponse:
     print(f"Joining game with request: {request}")
+    if not request.code and not http_request.headers.get(FORWARDED_HEADER):
+        # Matchmaking: the fullest open game of any group replicated here, whoever leads it.
+        game = game_manager.find_available_game(list(http_request.app.state.raft_groups))
+        if game is not None:
+            try:
+                reply = await join_on_leader(JoinRequest(name=request.name, code=game.code), http_request)
+                if not isinstance(reply, Response) or reply.status_code != 400:
+                    return reply
+            except HTTPException as e:
+                if e.status_code != 400:
+                    raise
+            # The game filled up or started meanwhile: fall back to a new game.
+    return await join_on_leader(request, http_request)
+
+
+@router.get("/games/open")
+async def open_game(http_request: Request):
+    """The fullest open game of the groups replicated here, for a gateway matchmaking across its workers."""
+    game = game_manager.find_available_game(list(http_request.app.state.raft_groups))
+    return {"code": game.code if game else None, "players": len(game.player_ids) if game else 0}
+
+
+async def join_on_leader(request: JoinRequest, http_request: Request):
+    """Join on the leader of the game's group, or create a game on any group leader without a code."""
+    forwarded = await forward_to_leader(http_request, group_nodes(http_request.app, request.code), body=request.model_dump_json().encode())
+    if forwarded is not None:
+        return forwarded
     try:
         game, player = await game_manager.join_or_create_game(request.name, request.code)
         token = create_token(player.id, player.name)
-        return JoinResponse(status=True, code=game.code, players=game.players, token=token, player_id=player.id)
+        return JoinResponse(status=True, code=game.code, players=game.to_model().players, token=token, player_id=player.id)
+    except TooManyGamesError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    except NotLeaderError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     
 
-@router.get("/game/{code}")
+@router.get("/game/{code}", dependencies=[Depends(ensure_consistent_read)])
 async def get_game(code: str) -> Game:
     try:
-        return game_manager.get_game(code)
+        return game_manager.get_game(code).to_model()
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     
 
-async def listen_to_events(websocket: WebSocket, code: str, player, game: Game):
+async def run_action(code: str, player: Player, request: ActionRequest) -> None:
+    """Run a player's action on the group leader. Its events reach every node's clients as the commands apply."""
+    if request.action == "start":
+        await game_manager.start_game(code)
+    elif request.action == "roll":
+        await game_manager.roll_dice(code, player.id)
+    elif request.action == "move":
+        token_idx = request.token_idx if request.token_idx is not None else -1
+        _, _, just_won, _ = await game_manager.move_piece(code, player.id, token_idx)
+        if just_won:
+            await game_manager.clear_game(code)
+    elif request.action == "presence":
+        await game_manager.set_player_state(code, player.id, bool(request.online))
+
+
+@router.post("/game/{code}/actions")
+async def game_action(code: str, request: ActionRequest, http_request: Request):
+    """An action of a player connected to a follower, forwarded to the leader on their behalf."""
+    forwarded = await forward_to_leader(http_request, group_nodes(http_request.app, code))
+    if forwarded is not None:
+        return forwarded
+    player = get_request_player(http_request)
+    try:
+        ensure_player_in_game(game_manager.get_game(code), player.id)
+        await run_action(code, player, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NotLeaderError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={NOT_LEADER_HEADER: "1"})
+    return {"status": True}
+
+
+async def handle_action(websocket: WebSocket, code: str, player: Player, token: str, request: ActionRequest) -> None:
+    """Run an action here if this node leads the game's group, otherwise on the leader. Raises ValueError if it failed."""
+    try:
+        reply = await forward_action(group_node(websocket.app, code), code, token, request.model_dump(exclude_none=True))
+    except HTTPException as e:
+        raise ValueError(e.detail)
+    except asyncio.TimeoutError:
+        raise ValueError("Leader node failed, please try again.")
+    if reply is None:
+        try:
+            await run_action(code, player, request)
+        except (NotLeaderError, asyncio.TimeoutError) as e:
+            raise ValueError(str(e) or "Leader node failed, please try again.")
+    elif reply.status_code != 200:
+        is_json = reply.headers.get("content-type", "").startswith("application/json")
+        raise ValueError(reply.json().get("detail") if is_json else reply.text)
+
+
+async def listen_to_events(websocket: WebSocket, code: str, player: Player, token: str):
     try:
         while True:
             data = await websocket.receive_json()
-            ensure_raft_leader(websocket)
-
-            action = data.get("action", "")
-
-            if action == "start":
-                await game_manager.start_game(game.code)
-                await ws_manager.broadcast(code, {"type": "game_started", "current_turn": game.players[game.current_turn].model_dump()})
-            elif action == "roll":
-                try:
-                    roll, next_turn = await game_manager.roll_dice(code, player.id)
-                    await ws_manager.broadcast(code, {"type": "roll", "player": player.id, "roll": roll, "next_turn": next_turn.model_dump() if next_turn else None})
-                
-                except ValueError as e:
-                    await websocket.send_json({"type": "error", "message": str(e)})
-            elif action == "move":
-                token_idx = data.get("token_idx")
-                try:
-                    positions, next_player, just_won, skip = await game_manager.move_piece(code, player.id, token_idx)
-                    await ws_manager.broadcast(code, {"type": "move", "player": player.id, "positions": positions, "next_player": next_player.model_dump() if next_player else None})
-                    if just_won:
-
-                        await ws_manager.broadcast(code, {"type": "win", "winner": player.model_dump()})
-                        await ws_manager.clear_game(code)
-                        await game_manager.clear_game(code)
-                    if skip:
-                        await ws_manager.broadcast(code, {"type": "state", "positions": game.positions, "next_turn": game.players[game.current_turn].model_dump()})
-                except ValueError as e:
-                    await websocket.send_json({"type": "error", "message": str(e)})           
+            try:
+                await handle_action(websocket, code, player, token, ActionRequest.model_validate(data))
+            except ValueError as e:
+                ws_manager.send(code, websocket, {"type": "error", "message": str(e)})
     except Exception as e:
         logger.error(f"[Player: {player.name}] WebSocket error: {e}")
-        await game_manager.set_player_state(code, player.id, False)
-        await ws_manager.broadcast(code, {"type": "player_left", "player": player.model_dump()}, skip_self=True, sender=websocket)
+        ws_manager.disconnect(code, websocket)
+        try:
+            # Nothing to report once the game is over and cleared.
+            game_manager.get_game(code)
+            await handle_action(websocket, code, player, token, ActionRequest(action="presence", online=False))
+        except ValueError:
+            pass
         raise e
     
 
 
 @router.websocket("/ws/game/{code}")
-async def websocket_game(websocket: WebSocket, code: str, _is_leader: None = Depends(ensure_raft_leader)):
+async def websocket_game(websocket: WebSocket, code: str):
     try:
         player, token = await get_current_player(websocket)
+        raft_node = group_node(websocket.app, code)
+        if raft_node is not None and not raft_node.is_leader():
+            # The player's join may not be applied here yet.
+            try:
+                await raft_node.read_barrier()
+            except (NotLeaderError, asyncio.TimeoutError):
+                error = WebSocketError.SERVICE_UNAVAILABLE
+                raise WebSocketException(code=error.code, reason=error.reason)
         game = game_manager.get_game(code)
         ensure_player_in_game(game, player.id)
 
+        # Leader or follower, the client stays on this node: events are pushed as
+        # commands apply here, and actions are forwarded to the leader.
         await websocket.accept(subprotocol=token)
         await ws_manager.connect(code, websocket)
+        # A reconnecting client passes the last version it saw and gets what it missed.
+        version = websocket.query_params.get("version")
+        if version is not None and version.isdigit():
+            ws_manager.resume(code, websocket, int(version))
 
-        await game_manager.set_player_state(code, player.id, True)
-        await ws_manager.broadcast(code, {"type": "player_joined", "player": player.model_dump()})
-
-        await listen_to_events(websocket, code, player, game)
+        await handle_action(websocket, code, player, token, ActionRequest(action="presence", online=True))
+        await listen_to_events(websocket, code, player, token)
 
 
     except WebSocketException as e:
@@ -104,4 +188,3 @@ async def websocket_game(websocket: WebSocket, code: str, _is_leader: None = Dep
 
 
     
-
@@ -1,6 +1,6 @@
 from typing import Tuple
 
-from fastapi import WebSocket, WebSocketException
+from fastapi import HTTPException, Request, WebSocket, WebSocketException
 from app.models import Player
 from app.utils.jwt import verify_token
 
@@ -16,4 +16,17 @@ async def get_current_player(websocket: WebSocket) -> Tuple[Player, str]:
     if not payload:
         raise WebSocketException(code=4001, reason="Invalid token")
 
-    return Player(id=payload["sub"], name=payload["name"]), token
\ No newline at end of file
+    return Player(id=payload["sub"], name=payload["name"]), token
+
+
+def get_request_player(request: Request) -> Player:
+    """
+    Get the player from a request's bearer token, e.g. an action a follower
+    forwards for one of its WebSocket clients.
+    """
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    payload = verify_token(token) if scheme.lower() == "bearer" and token else None
+    if not payload:
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    return Player(id=payload["sub"], name=payload["name"])
@@ -0,0 +1,78 @@
+import json
+from typing import Any, Callable, Dict, Union
+
+from app.raft_grpc.raft_pb2 import (
+    LogEntry as PbLogEntry,
+    Command,
+    CreateGame,
+    JoinGame,
+    RollDice,
+    MovePiece,
+    ClearGame,
+    StartGame,
+    SetPlayerState,
+    EvictGames,
+)
+
+# Builds the typed Command for a @raft_command name from the decorated method's arguments.
+ENCODERS: Dict[str, Callable[..., Command]] = {
+    "create_game": lambda code: Command(create_game=CreateGame(code=code)),
+    "join_game": lambda code, player: Command(join_game=JoinGame(
+        code=code,
+        player_id=player["id"],
+        name=player["name"],
+        is_online=player.get("is_online", False),
+    )),
+    "roll_dice": lambda code, pending_roll, current_turn, roll=0, player_id="": Command(roll_dice=RollDice(
+        code=code,
+        pending_roll=pending_roll,
+        current_turn=current_turn,
+        roll=roll,
+        player_id=player_id,
+    )),
+    "move_piece": lambda code, player_id, piece_index, new_position: Command(move_piece=MovePiece(
+        code=code,
+        player_id=player_id,
+        piece_index=piece_index,
+        new_position=new_position,
+    )),
+    "clear_game": lambda code: Command(clear_game=ClearGame(code=code)),
+    "start_game": lambda code: Command(start_game=StartGame(code=code)),
+    "set_player_state": lambda code, player_id, online: Command(set_player_state=SetPlayerState(
+        code=code,
+        player_id=player_id,
+        online=online,
+    )),
+    "evict_games": lambda codes, versions: Command(evict_games=EvictGames(codes=codes, versions=versions)),
+}
+
+
+def encode_command(command: str, *args: Any) -> bytes:
+    """Serialize a game command into the compact binary form stored in the Raft log."""
+    return ENCODERS[command](*args).SerializeToString()
+
+
+def decode_command(data: Union[bytes, str]) -> Command:
+    """
+    Parse a log entry's command. Entries written before typed commands carry
+    the old JSON string and are converted on the fly.
+    """
+    if isinstance(data, str):
+        legacy = json.loads(data)
+        return ENCODERS[legacy["command"]](*legacy["args"])
+    return Command.FromString(data)
+
+
+def entry_to_pb(entry: Dict) -> PbLogEntry:
+    command = entry["command"]
+    if entry.get("config"):
+        return PbLogEntry(term=entry["term"], config=entry["config"])
+    if isinstance(command, str):
+        return PbLogEntry(term=entry["term"], command=command)
+    return PbLogEntry(term=entry["term"], data=command)
+
+
+def entry_from_pb(entry: PbLogEntry) -> Dict:
+    if entry.config:
+        return {"term": entry.term, "command": "", "config": entry.config}
+    return {"term": entry.term, "command": entry.data or entry.command}
@@ -1 +1,6 @@
-MAXIMUM_ALLOWED_PLAYERS = 4
\ No newline at end of file
+MAXIMUM_ALLOWED_PLAYERS = 4
+TOKENS_PER_PLAYER = 4
+# Cells of the shared track; positions from here on are a player's finish lane.
+TRACK_LENGTH = 40
+# Track cells between the start cells of consecutive players.
+START_SPACING = 10
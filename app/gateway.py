@@ -0,0 +1,206 @@
+"""
+Multi-process node: the gateway accepts HTTP and WebSocket traffic on the
+node's public port and forwards it over a unix socket to the worker process
+running the game's Raft group. Each worker is a regular app.main process
+that only runs its share of the groups (see RAFT_WORKERS in raft.yaml).
+
+    RAFT_NODE_ID="node1" uvicorn app.gateway:app --port 8081 --host 0.0.0.0
+"""
+import os
+import re
+import sys
+import json
+import asyncio
+import logging
+import tempfile
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+import httpx
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import PlainTextResponse
+from fastapi.middleware.cors import CORSMiddleware
+from websockets.asyncio.client import unix_connect
+from websockets.exceptions import InvalidHandshake
+
+from app.raft import RAFT_NODE_ID, RAFT_WORKERS, group_of, worker_of
+from app.raftnode import ELECTION_TIMEOUT, RPC_TIMEOUT
+from app.ws_error_codes import WebSocketError
+from app.utils.proxy import forward_http, relay_websocket
+
+logger = logging.getLogger(__name__)
+
+# /game/{code}, /game/{code}/actions and /ws/game/{code}
+GAME_PATH = re.compile(r"^/(?:ws/)?game/(?!join$)([^/]+)(?:/actions)?$")
+# /raft/groups/{group_id}/...
+GROUP_PATH = re.compile(r"^/raft/groups/(\d+)/")
+WORKER_POLL_INTERVAL = 1.0
+# A worker waits out an election for up to twice the maximum election timeout,
+# then gives the leader 5 RPC timeouts to answer (see call_leader): wait longer
+# than that, so a failover is not reported as the worker being unavailable.
+# Membership changes wait for a learner to catch up, bounded by add_server
+# itself, so /raft/groups requests have no read timeout.
+WORKER_TIMEOUT = httpx.Timeout(2 * ELECTION_TIMEOUT[1] + 6 * RPC_TIMEOUT, connect=WORKER_POLL_INTERVAL)
+MEMBERSHIP_TIMEOUT = httpx.Timeout(None, connect=WORKER_POLL_INTERVAL)
+
+processes: List[asyncio.subprocess.Process] = []
+clients: Dict[int, httpx.AsyncClient] = {}
+# Worker -> Raft groups it currently leads, refreshed from the workers' /health.
+worker_leads: Dict[int, List[int]] = {worker: [] for worker in range(RAFT_WORKERS)}
+next_worker = 0
+
+
+def socket_path(worker: int) -> str:
+    return os.path.join(tempfile.gettempdir(), f"mensch-{RAFT_NODE_ID}-worker{worker}.sock")
+
+
+def route(code: Optional[str]) -> int:
+    """Worker for a request: the one running the game's group, or any group leader for new games."""
+    global next_worker
+    if code:
+        return worker_of(group_of(code))
+
+    leading = [worker for worker, groups in worker_leads.items() if groups]
+    if not leading:
+        return 0
+    next_worker += 1
+    return leading[next_worker % len(leading)]
+
+
+async def find_open_game() -> Optional[str]:
+    """Code of the fullest open game of any worker, so code-less joins meet whichever worker they reach."""
+    async def offer(client: httpx.AsyncClient) -> dict:
+        try:
+            return (await client.get("/games/open", timeout=WORKER_POLL_INTERVAL)).json()
+        except (httpx.HTTPError, ValueError):
+            return {}
+
+    offers = [offer for offer in await asyncio.gather(*(offer(client) for client in clients.values())) if offer.get("code")]
+    return max(offers, key=lambda offer: offer["players"])["code"] if offers else None
+
+
+async def watch_workers() -> None:
+    """Keep track of which worker leads which groups, for routing new games."""
+    while True:
+        for worker, client in clients.items():
+            try:
+                reply = await client.get("/health", timeout=WORKER_POLL_INTERVAL)
+                worker_leads[worker] = [int(group) for group in reply.text.split(",") if group]
+            except httpx.HTTPError:
+                worker_leads[worker] = []
+        await asyncio.sleep(WORKER_POLL_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for worker in range(RAFT_WORKERS):
+        path = socket_path(worker)
+        if os.path.exists(path):
+            os.remove(path)
+        env = dict(os.environ, RAFT_NODE_ID=RAFT_NODE_ID, RAFT_WORKER=str(worker))
+        processes.append(await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "uvicorn", "app.main:app", "--uds", path, env=env
+        ))
+        clients[worker] = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=path), base_url="http://worker", timeout=WORKER_TIMEOUT)
+    logger.info(f"Node {RAFT_NODE_ID} started {RAFT_WORKERS} workers")
+    watcher = asyncio.create_task(watch_workers())
+
+    yield
+
+    watcher.cancel()
+    for client in clients.values():
+        await client.aclose()
+    for process in processes:
+        process.terminate()
+    await asyncio.gather(*(process.wait() for process in processes))
+
+
+app = FastAPI(title="Mensch ärgere Dich nicht", version="0.1.0", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+@app.get("/health")
+async def health_check():
+    """Groups led by any of this node's workers, in the format of the single-process /health."""
+    groups = sorted(group for leads in worker_leads.values() for group in leads)
+    return PlainTextResponse(",".join(str(group) for group in groups), status_code=200)
+
+
+@app.get("/metrics")
+async def metrics():
+    """Metrics of all workers, each metric family kept together."""
+    families: Dict[str, List[str]] = {}
+    for worker, client in clients.items():
+        try:
+            reply = await client.get("/metrics", timeout=WORKER_POLL_INTERVAL)
+        except httpx.HTTPError as e:
+            logger.warning(f"Worker {worker} metrics unavailable: {e}")
+            continue
+        for line in reply.text.splitlines():
+            name = line.split()[2] if line.startswith("#") else line.split("{")[0].split()[0]
+            lines = families.setdefault(name, [])
+            if line not in lines:
+                lines.append(line)
+    return PlainTextResponse("".join(line + "\n" for lines in families.values() for line in lines))
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD"])
+async def proxy_http(request: Request, path: str):
+    body = await request.body()
+    match = GAME_PATH.match(request.url.path)
+    code = match.group(1) if match else None
+    group = GROUP_PATH.match(request.url.path)
+    try:
+        if request.method == "POST" and request.url.path == "/game/join":
+            try:
+                join = json.loads(body)
+                code = join.get("code") or None
+            except (ValueError, AttributeError):
+                join, code = None, None
+            if join is not None and code is None and RAFT_WORKERS > 1:
+                # Each worker only matches games of its own groups: pick one across all of them.
+                code = await find_open_game()
+                if code is not None:
+                    reply = await forward_http(clients[route(code)], request, json.dumps({**join, "code": code}).encode())
+                    if reply.status_code != 400:
+                        return reply
+                    # The game filled up or started meanwhile: create a new game instead.
+                    code = None
+
+        if group:
+            return await forward_http(clients[worker_of(int(group.group(1)))], request, body, timeout=MEMBERSHIP_TIMEOUT)
+        return await forward_http(clients[route(code)], request, body)
+    except httpx.HTTPError as e:
+        logger.error(f"Worker unavailable for {request.url.path}: {e}")
+        return PlainTextResponse("Worker unavailable", status_code=503)
+
+
+@app.websocket("/{path:path}")
+async def proxy_websocket(websocket: WebSocket, path: str):
+    match = GAME_PATH.match(websocket.url.path)
+    worker = route(match.group(1) if match else None)
+    uri = f"ws://worker{websocket.url.path}" + (f"?{websocket.url.query}" if websocket.url.query else "")
+    # The player's token travels as the subprotocol; offer the worker the same ones.
+    protocols = [p.strip() for p in websocket.headers.get("sec-websocket-protocol", "").split(",") if p.strip()]
+
+    try:
+        upstream = await unix_connect(socket_path(worker), uri, subprotocols=protocols or None)
+    except (OSError, InvalidHandshake) as e:
+        logger.warning(f"Worker {worker} refused WebSocket {websocket.url.path}: {e}")
+        await websocket.close(code=WebSocketError.SERVICE_UNAVAILABLE.code, reason=WebSocketError.SERVICE_UNAVAILABLE.reason)
+        return
+
+    await websocket.accept(subprotocol=upstream.subprotocol)
+    client_gone = await relay_websocket(websocket, upstream, [])
+    await upstream.close()
+    if not client_gone:
+        # Relay the worker's close code; 1005/1006 only describe a missing close frame.
+        code = upstream.close_code if upstream.close_code not in (None, 1005, 1006) else 1000
+        await websocket.close(code=code, reason=upstream.close_reason or "")
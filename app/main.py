@@ -1,16 +1,23 @@
-from fastapi import FastAPI, Request, HTTPException, Depends
-from fastapi.responses import RedirectResponse, PlainTextResponse
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 import asyncio
+from typing import Dict
 from contextlib import asynccontextmanager
 
+import logging
+
 from fastapi.middleware.cors import CORSMiddleware
 from app.api import router
-from app.raft import router as raft_router, startup_event, grpc_server, cfg
+from app.raft import router as raft_router, startup_event, grpc_server, cfg, led_groups
 from app.utils.util import load_yaml
-from app.raftnode import RaftNode
+from app.raftnode import RaftNode, NotLeaderError
+from app.manager import game_manager
 
+logger = logging.getLogger(__name__)
 
-raft_node: RaftNode = None
+raft_groups: Dict[int, RaftNode] = {}
+# Seconds between idle game sweeps (see GAME_EVICTION in raft.yaml).
+SWEEP_INTERVAL: float = (cfg.get("GAME_EVICTION") or {}).get("sweep_interval", 60)
 
 
 # def start_raft_thread():
@@ -27,16 +34,32 @@ raft_node: RaftNode = None
 #     loop.create_task(raft_node.run())
 #     loop.run_forever()
 
+async def sweep_idle_games():
+    """Evict idle games in the groups this node leads; their WebSockets close as the eviction applies."""
+    while True:
+        await asyncio.sleep(SWEEP_INTERVAL)
+        try:
+            codes = await game_manager.evict_idle_games()
+        except NotLeaderError:
+            continue
+        except Exception:
+            # Keep sweeping: one failed round (e.g. a slow commit) must not end the loop.
+            logger.exception("Idle game sweep failed")
+            continue
+        if codes:
+            logger.info(f"Evicted {len(codes)} idle games")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global raft_node
+    global raft_groups
     
-    raft_node = startup_event()
-    app.state.raft_node = raft_node
+    raft_groups = startup_event()
+    app.state.raft_groups = raft_groups
 
     asyncio.create_task(grpc_server())
-    asyncio.create_task(raft_node.run())
-
+    for raft_node in raft_groups.values():
+        asyncio.create_task(raft_node.run())
+    asyncio.create_task(sweep_idle_games())
 
     yield  # This will run when the app starts
 
@@ -56,37 +79,30 @@ app.add_middleware(
     allow_headers=["*"],        # Content-Type, Authorization…
 )
 
-@app.middleware("http")
-async def raft_leader_middleware(request: Request, call_next):
-    """
-    Middleware to check if the current node is the leader.
-    If not, it raises a 503 Service Unavailable error.
-    """
-    if request.method in ["GET", "HEAD", "OPTIONS"]:
-        
-        return await call_next(request)
-    
-    if raft_node and not await raft_node.is_leader():
-        print(f"raft_node is not leader, redirecting to leader... {raft_node}")
-        if not raft_node.leader_id:
-            raise HTTPException(status_code=503, detail="No leader node available")
-        leader = next((member for member in cfg["RAFT_CLUSTER"] if member["id"] == raft_node.leader_id), None)
-        if not leader:
-            raise HTTPException(status_code=503, detail="Leader node not found in cluster")
-        print(f"Redirecting to leader node: {leader['server']}")
-        return RedirectResponse(f"http://{leader['server']}{request.url.path}")
-    
-    print(f"raft_node is leader, processing request... {raft_node}")
-    response = await call_next(request)
-    return response
-
 @app.get("/health")
 async def health_check():
     """
     Health check endpoint to verify if the service is running.
+    The body lists the Raft groups this node leads, comma separated (empty if none).
     """
-    if raft_node and await raft_node.is_leader():
-        return PlainTextResponse("1", status_code=200)
-    return PlainTextResponse("0", status_code=200)
-
-app.include_router(router)
\ No newline at end of file
+    return PlainTextResponse(",".join(str(group_id) for group_id in led_groups()), status_code=200)
+
+@app.get("/metrics")
+async def metrics():
+    """Game table metrics of this node's groups, in the Prometheus text format."""
+    lines = [
+        "# HELP mensch_games Games held in memory, by state (live: a player is online).",
+        "# TYPE mensch_games gauge",
+    ]
+    shards = {group_id: game_manager.shards[group_id].stats() for group_id in raft_groups}
+    for group_id, stats in shards.items():
+        lines.append(f'mensch_games{{group="{group_id}",state="live"}} {stats["live"]}')
+        lines.append(f'mensch_games{{group="{group_id}",state="idle"}} {stats["idle"]}')
+    lines += ["# HELP mensch_games_evicted_total Idle games evicted.", "# TYPE mensch_games_evicted_total counter"]
+    lines += [f'mensch_games_evicted_total{{group="{group_id}"}} {stats["evicted"]}' for group_id, stats in shards.items()]
+    lines += ["# HELP mensch_game_bytes Approximate memory held by the games in memory.", "# TYPE mensch_game_bytes gauge"]
+    lines += [f'mensch_game_bytes{{group="{group_id}"}} {stats["bytes"]}' for group_id, stats in shards.items()]
+    return PlainTextResponse("\n".join(lines) + "\n")
+
+app.include_router(router)
+app.include_router(raft_router, prefix="/raft")
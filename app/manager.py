@@ -1,104 +1,270 @@
 import json
+import time
+import logging
 
-from typing import Optional, Tuple, List, Dict
+from typing import Callable, Optional, Tuple, List, Dict
 import uuid
 import random
 import string
-from app.models import Game, Player
-from app.constants import MAXIMUM_ALLOWED_PLAYERS
-from app.raft import raft_command
+from app.models import GameState, Player
+from app.constants import MAXIMUM_ALLOWED_PLAYERS, TOKENS_PER_PLAYER, TRACK_LENGTH
+from app.raft import raft_command, group_of, led_groups, RAFT_GROUPS, cfg
+from app.raftnode import NotLeaderError
+from app.commands import decode_command
 
 NAMESPACE = uuid.UUID("4372ffc4-1acd-4df8-803f-361787fb5e06") # UUID for the namespace
-START_OFFSET = {} 
+# Codes per EvictGames command, to keep log entries small.
+EVICTION_BATCH_SIZE = 256
+
+logger = logging.getLogger(__name__)
+
+
+class TooManyGamesError(Exception):
+    """Raised when a group already holds max_games games."""
 
 
 class GameManager:
-    def __init__(self):
-        self.games: Dict[str, Game] = {}
+    """Games of one Raft group; commands are replicated through that group's log."""
+    def __init__(self, group_id: int = 0, idle_ttl: float = 0, max_games: int = 0):
+        self.group_id = group_id
+        self.games: Dict[str, GameState] = {}
+        # Games without a command for idle_ttl seconds are evicted, and no more than
+        # max_games are created (0 disables either).
+        self.idle_ttl = idle_ttl
+        self.max_games = max_games
+        # Last command per game (monotonic time, least recently active first), the
+        # memory each game holds in bytes, and how many games were evicted.
+        self.last_active: Dict[str, float] = {}
+        self.game_bytes: Dict[str, int] = {}
+        self.evicted = 0
+        # Open games (not started, not full) by player count, oldest first within
+        # a count; matchmaking picks the fullest. Updated in log order on every
+        # replica, alongside self.games.
+        self.open_games: List[Dict[str, None]] = [{} for _ in range(MAXIMUM_ALLOWED_PLAYERS)]
+        self.handlers: Dict[str, Callable] = {
+            "create_game": self.apply_create_game,
+            "join_game": self.apply_join_game,
+            "roll_dice": self.apply_roll_dice,
+            "move_piece": self.apply_move_piece,
+            "clear_game": self.apply_clear_game,
+            "start_game": self.apply_start_game,
+            "set_player_state": self.apply_set_player_state,
+            "evict_games": self.apply_evict_games,
+        }
+        # Called with (code, event) for every game event as its command is applied
+        # here, on the leader and on followers alike. The event is None when the
+        # game was removed or replaced by a snapshot.
+        self.listeners: List[Callable[[str, Optional[Dict]], None]] = []
     
+    def snapshot(self) -> bytes:
+        """Serialize every game into a point-in-time Raft snapshot."""
+        return json.dumps({code: game.to_dict() for code, game in self.games.items()}).encode("utf-8")
+
+    def restore(self, data: bytes) -> None:
+        """Replace all games with the contents of a Raft snapshot."""
+        previous = self.games
+        self.games = {code: GameState.from_dict(game) for code, game in json.loads(data).items()}
+        self.open_games = [{} for _ in range(MAXIMUM_ALLOWED_PLAYERS)]
+        self.last_active = {}
+        self.game_bytes = {}
+        for game in self.games.values():
+            self.index_game(game)
+            self.track(game)
+        for code in previous.keys() | self.games.keys():
+            self.emit(code, None)
+
+    def emit(self, code: str, event: Optional[Dict]) -> None:
+        for listener in self.listeners:
+            listener(code, event)
+
+    def player_event(self, game: GameState, seat: int) -> Dict:
+        return {"type": "player_joined" if game.online[seat] else "player_left", "player": game.player(seat)}
+
+    def roll_event(self, game: GameState, seat: int, roll: int) -> Dict:
+        next_turn = game.player(game.current_turn) if game.pending_roll is None else None
+        return {"type": "roll", "player": game.player_ids[seat], "roll": roll, "next_turn": next_turn}
+
+    def move_events(self, game: GameState, seat: int, captured: bool, just_won: bool) -> List[Dict]:
+        next_player = None if just_won else game.player(game.current_turn)
+        events = [{"type": "move", "player": game.player_ids[seat], "positions": game.positions_of(seat), "next_player": next_player}]
+        if just_won:
+            events.append({"type": "win", "winner": game.player(seat)})
+        if captured:
+            events.append({"type": "state", "positions": game.all_positions(), "next_turn": game.player(game.current_turn)})
+        return events
+
+    def index_game(self, game: GameState) -> None:
+        """File a game under its player count in the open-games index, or drop it once full or started."""
+        self.unindex_game(game.code)
+        if not game.started and len(game.player_ids) < MAXIMUM_ALLOWED_PLAYERS:
+            self.open_games[len(game.player_ids)][game.code] = None
+
+    def unindex_game(self, code: str) -> None:
+        for bucket in self.open_games:
+            bucket.pop(code, None)
+
+    def track(self, game: GameState) -> None:
+        """Move a game to the back of the idle order and re-measure it."""
+        self.last_active.pop(game.code, None)
+        self.last_active[game.code] = time.monotonic()
+        self.game_bytes[game.code] = game.nbytes()
+
+    def touch(self, code: str) -> None:
+        """Record a command on a game: bump its version and track its activity."""
+        game = self.games.get(code)
+        if game is None:
+            return
+        game.version += 1
+        self.track(game)
+
+    def forget_game(self, code: str) -> None:
+        self.games.pop(code, None)
+        self.unindex_game(code)
+        self.last_active.pop(code, None)
+        self.game_bytes.pop(code, None)
+        self.emit(code, None)
+
+    def idle_games(self) -> List[str]:
+        """Games without a command for idle_ttl seconds, least recently active first."""
+        if not self.idle_ttl:
+            return []
+        deadline = time.monotonic() - self.idle_ttl
+        codes = []
+        for code, last_active in self.last_active.items():
+            if last_active > deadline:
+                break
+            codes.append(code)
+        return codes
+
+    def stats(self) -> Dict[str, int]:
+        """Live games have an online player, idle ones none."""
+        live = sum(1 for game in self.games.values() if any(game.online))
+        return {"live": live, "idle": len(self.games) - live, "evicted": self.evicted, "bytes": sum(self.game_bytes.values())}
+
     def generate_game_code(self, length=6):
         """Generate a unique game code."""
         return ''.join(random.choices(string.ascii_uppercase, k=length))
         
     def apply_command(self, cmd):
         """
-        Apply commands to the game manager.
-
-        create_game: [code: str]
-        join_game: [code:str, player: {name: str, id: str, is_online: bool}]
-        roll_dice: [code:str, pending_roll:Optional[int], current_turn: int]
-        move_piece: [code:str, player_id: str, piece_index: int, new_position: int]
-        clear_game: [code:str]
-        start_game: [code:str]
-        set_player_state: [code:str, player_id: str, online: bool]
+        Apply a committed Raft log entry to the game manager.
+
+        The entry is a typed Command (see raft.proto); the set oneof field
+        selects the handler from the dispatch table. Returns the events the
+        command emitted, None if it no longer applied.
+
+        A committed entry must never raise: the leader validated it against
+        its state when proposing, but the game may have changed since (it was
+        cleared, filled up or moved on), and then every replica skips it alike.
         """
-        cmd = json.loads(cmd)
-        print(f"Applying command: {cmd['command']} with args: {cmd['args']}")
-        if cmd["command"] == "create_game":
-            self.games[cmd['args'][0]] = Game(code=cmd['args'][0])
-        elif cmd["command"] == "join_game":
-            game = self.games[cmd['args'][0]]
-            player = Player(**cmd['args'][1])
-            game.players.append(player)
-            game.init_positions()
-
-            for idx, p in enumerate(game.players):
-                game.start_offset[p.id] = idx * 10
-
-        elif cmd["command"] == "roll_dice":
-            game = self.games[cmd['args'][0]]
-
-            game.pending_roll = cmd['args'][1]
-            game.current_turn = cmd['args'][2]
-
-        elif cmd["command"] == "move_piece":
-            code, player_id, piece_index, new_position = cmd['args']
-            game = self.games[code]
-
-            game.positions[player_id][piece_index] = new_position
-            _pending_roll = game.pending_roll
-            game.pending_roll = None
-
-            just_won = all(pos >= 40 for pos in game.positions[player_id])
-            if not just_won:
-                game.current_turn = self.get_next_turn(game, last_roll=_pending_roll)
-        
-        elif cmd["command"] == "clear_game":
-            code = cmd['args'][0]
-            if code in self.games:
-                del self.games[code]
-        elif cmd["command"] == "start_game":
-            self.games[cmd['args'][0]].started = True
-        elif cmd["command"] == "set_player_state":
-            code, player_id, online = cmd['args']
-            game = self.games[code]
-
-            pid = next((i for i, p in enumerate(game.players) if p.id == player_id), 0)
-            game.players[pid].is_online = online
+        command = decode_command(cmd)
+        op = command.WhichOneof("op")
+        logger.debug(f"Applying command: {op}")
+        msg = getattr(command, op)
+        if op not in ("create_game", "evict_games") and msg.code not in self.games:
+            events = None
+        else:
+            events = self.handlers[op](msg)
+        if events is None:
+            logger.warning(f"Skipping {op} command that no longer applies to game {getattr(msg, 'code', '')}")
+            return None
+        if op != "evict_games":
+            self.touch(msg.code)
+        for event in events or ():
+            self.emit(msg.code, event)
+        return events
+
+    def apply_create_game(self, msg):
+        if msg.code in self.games:
+            return None
+        self.games[msg.code] = GameState(msg.code)
+        self.index_game(self.games[msg.code])
+        return []
+
+    def apply_join_game(self, msg):
+        game = self.games[msg.code]
+        if game.started or len(game.player_ids) >= MAXIMUM_ALLOWED_PLAYERS or msg.name in game.names:
+            return None
+        game.add_player(msg.player_id, msg.name, msg.is_online)
+        self.index_game(game)
+        return []
+
+    def apply_roll_dice(self, msg):
+        game = self.games[msg.code]
+        seat = game.current_turn
+        # A second roll proposed before the first applied (e.g. from two sockets).
+        if game.pending_roll is not None or (msg.player_id and game.seat_of(msg.player_id) != seat):
+            return None
+
+        game.pending_roll = msg.pending_roll if msg.HasField("pending_roll") else None
+        game.current_turn = msg.current_turn
+        return [self.roll_event(game, seat, msg.roll or msg.pending_roll)]
+
+    def apply_move_piece(self, msg):
+        game = self.games[msg.code]
+        seat = game.seat_of(msg.player_id)
+        if seat < 0 or game.pending_roll is None:
+            return None
+
+        captured = game.move_token(seat, msg.piece_index, msg.new_position)
+        _pending_roll = game.pending_roll
+        game.pending_roll = None
+
+        just_won = game.finished(seat)
+        if not just_won:
+            game.current_turn = self.get_next_turn(game, last_roll=_pending_roll)
+        return self.move_events(game, seat, captured, just_won)
+
+    def apply_clear_game(self, msg):
+        self.forget_game(msg.code)
+        return []
+
+    def apply_start_game(self, msg):
+        game = self.games[msg.code]
+        if game.started:
+            return None
+        game.started = True
+        self.unindex_game(msg.code)
+        return [{"type": "game_started", "current_turn": game.player(game.current_turn)}]
+
+    def apply_set_player_state(self, msg):
+        game = self.games[msg.code]
+
+        seat = game.seat_of(msg.player_id)
+        if seat < 0:
+            return None
+        game.online[seat] = msg.online
+        return [self.player_event(game, seat)]
+
+    def apply_evict_games(self, msg):
+        versions = list(msg.versions) or [None] * len(msg.codes)
+        for code, version in zip(msg.codes, versions):
+            game = self.games.get(code)
+            # Games that saw a command since the sweep read their version are no longer idle.
+            if game is not None and (version is None or game.version == version):
+                self.forget_game(code)
+                self.evicted += 1
+        return []
     
     @raft_command("create_game")
-    async def _create_game(self, code: str) -> Game:
-        game = Game(code=code)
-        self.games[code] = game
-
-        return game 
+    async def _create_game(self, code: str) -> None:
+        if code in self.games:
+            raise ValueError("Game already exists.")
     
-    async def create_game(self) -> Game:
+    async def create_game(self) -> GameState:
+        if self.max_games and len(self.games) >= self.max_games:
+            raise TooManyGamesError("Too many games, please try again later.")
         code = self.generate_game_code()
-        while code in self.games:
+        while code in self.games or group_of(code) != self.group_id:
             code = self.generate_game_code()
         
-        return await self._create_game(code)
+        await self._create_game(code)
+
+        return self.get_game(code)
     
     @raft_command("join_game")
     async def _join_game(self, code: str, player: Dict) -> None:
-        game = self.games[code]
-
-        game.players.append(Player(**player))
-        game.init_positions()
-
-        for idx, p in enumerate(game.players):
-            game.start_offset[p.id] = idx * 10
+        self.get_game(code)
     
     async def join_game(self, code: str, player: Player):
         """Join an existing game."""
@@ -107,9 +273,9 @@ class GameManager:
         
         game = self.games[code]
 
-        if len(game.players) >= MAXIMUM_ALLOWED_PLAYERS:
+        if len(game.player_ids) >= MAXIMUM_ALLOWED_PLAYERS:
             raise ValueError("Game is full.")
-        if any(p.name == player.name for p in game.players):
+        if player.name in game.names:
             raise ValueError("Player name already taken.")
         if game.started:
             raise ValueError("Game has already started.")
@@ -118,11 +284,11 @@ class GameManager:
 
         return game
     
-    def find_available_game(self):
-        """Find an available game."""
-        for game in self.games.values():
-            if len(game.players) < MAXIMUM_ALLOWED_PLAYERS and not game.started:
-                return game
+    def find_available_game(self) -> Optional[GameState]:
+        """The open game with the most players (the oldest among equals), from the open-games index."""
+        for bucket in reversed(self.open_games):
+            if bucket:
+                return self.games[next(iter(bucket))]
         return None
     
     async def join_or_create_game(self, name: str, code: Optional[str] = None):
@@ -143,7 +309,7 @@ class GameManager:
 
         return game, player
     
-    def get_game(self, code: str) -> Game:
+    def get_game(self, code: str) -> GameState:
         """Get game by code."""
         if code not in self.games:
             raise ValueError("Game not found.")
@@ -153,9 +319,9 @@ class GameManager:
         """Convert a name to a UUID."""
         return str(uuid.uuid5(NAMESPACE, name))
     
-    def get_movable_tokens(self, game: Game, player_id: str, roll) -> List[int]:
+    def get_movable_tokens(self, game: GameState, player_id: str, roll) -> List[int]:
         movable_tokens = []
-        for idx in range(4):
+        for idx in range(TOKENS_PER_PLAYER):
             try:
                 _ = self.get_token_new_position(game, player_id, idx, roll)
                 movable_tokens.append(idx)
@@ -164,12 +330,9 @@ class GameManager:
         return movable_tokens
     
     @raft_command("roll_dice")
-    async def _roll_dice(self, code: str, pending_roll: Optional[int], current_turn: int):
+    async def _roll_dice(self, code: str, pending_roll: Optional[int], current_turn: int, roll: int = 0, player_id: str = ""):
         """Internal method to set the pending roll and current turn."""
-        game = self.games[code]
-
-        game.pending_roll = pending_roll
-        game.current_turn = current_turn
+        self.get_game(code)
     
     async def roll_dice(self, code: str, player_id: str):
         """Roll the dice for a player."""
@@ -178,7 +341,7 @@ class GameManager:
         if game.pending_roll is not None:
             raise ValueError("Dice already rolled.")
         
-        if game.players[game.current_turn].id != player_id:
+        if game.player_ids[game.current_turn] != player_id:
             raise ValueError("Not your turn.")
         
         roll = random.randint(1, 6)
@@ -190,9 +353,9 @@ class GameManager:
         if not movable:
             _pending_roll = None
             _current_turn = self.get_next_turn(game)
-            next_turn = game.players[_current_turn]
+            next_turn = game.player(_current_turn)
         
-        await self._roll_dice(code, _pending_roll, _current_turn)
+        await self._roll_dice(code, _pending_roll, _current_turn, roll, player_id)
     
         return roll, next_turn
     
@@ -201,10 +364,11 @@ class GameManager:
             if i != index and pos == new_position:
                 raise ValueError("Position already taken.")
             
-    def get_token_new_position(self, game: Game, player_id: str, token_idx: int, roll: int) -> List[int]:
-        positions = game.positions[player_id]
+    def get_token_new_position(self, game: GameState, player_id: str, token_idx: int, roll: int) -> int:
+        seat = game.seat_of(player_id)
+        positions = game.positions_of(seat)
         current_position = positions[token_idx]
-        start = game.start_offset[player_id]
+        start = game.start_offset(seat)
 
         if current_position == -1:
             if roll == 6:
@@ -212,82 +376,62 @@ class GameManager:
             else:
                 raise ValueError("Need 6 to move out of home.")
                 
-        elif 0<= current_position < 40:
-            step_from_start = (current_position - start) % 40
+        elif 0<= current_position < TRACK_LENGTH:
+            step_from_start = (current_position - start) % TRACK_LENGTH
             total = step_from_start + roll
 
-            if total < 40:
-                new_position = (current_position + roll) % 40
+            if total < TRACK_LENGTH:
+                new_position = (current_position + roll) % TRACK_LENGTH
             else:
-                finish_position = total - 40
+                finish_position = total - TRACK_LENGTH
                 if finish_position > 3:
                     raise ValueError("Roll too large to enter finish lane.")
-                new_position = 40 + finish_position
+                new_position = TRACK_LENGTH + finish_position
         else:
-            finish_step = (current_position - 40) + roll
+            finish_step = (current_position - TRACK_LENGTH) + roll
             if finish_step > 3:
                 raise ValueError("Roll too large to move in finish lane.")
             new_position = current_position + roll
 
-        self.position_taken(game.positions[player_id], new_position, token_idx)
+        self.position_taken(positions, new_position, token_idx)
         
         return new_position
     
-    def get_next_turn(self, game: Game, last_roll: Optional[int] = None) -> int:
+    def get_next_turn(self, game: GameState, last_roll: Optional[int] = None) -> int:
         """Get the next player's turn."""
         if last_roll is not None and last_roll == 6:
             return game.current_turn
         
-        for i in range(1, len(game.players)+1):
-            iplayer = (game.current_turn + i) % len(game.players)
-            if game.players[iplayer].is_online:
+        for i in range(1, len(game.player_ids)+1):
+            iplayer = (game.current_turn + i) % len(game.player_ids)
+            if game.online[iplayer]:
                 break
         return iplayer
     
     @raft_command("move_piece")
-    async def _move_piece(self, code: str, player_id: str, piece_index: int, new_position: int) -> Tuple[Optional[Player], bool]:
-        game = self.games[code]
-
-        game.positions[player_id][piece_index] = new_position
-        _pending_roll = game.pending_roll
-        game.pending_roll = None
-
-        just_won = all(pos >= 40 for pos in game.positions[player_id])
-        if not just_won:
-            game.current_turn = self.get_next_turn(game, last_roll=_pending_roll)
-            next_player = game.players[game.current_turn]
-        else:
-            next_player = None
-        
-        return next_player, just_won
+    async def _move_piece(self, code: str, player_id: str, piece_index: int, new_position: int) -> None:
+        self.get_game(code)
 
-    async def move_piece(self, code: str, player_id: str, piece_index: int) -> Tuple[int, Optional[Player], bool]:
+    async def move_piece(self, code: str, player_id: str, piece_index: int) -> Tuple[List[int], Optional[Dict], bool, bool]:
         """Move a piece for a player."""
         game = self.get_game(code)
 
         if game.pending_roll is None:
             raise ValueError("No dice rolled.")
         
-        if game.players[game.current_turn].id != player_id:
+        if game.player_ids[game.current_turn] != player_id:
             raise ValueError("Not your turn.")
         
-        if not ( 0 <= piece_index < 4):
+        if not ( 0 <= piece_index < TOKENS_PER_PLAYER):
             raise ValueError("Invalid piece index.")
         
         new_position = self.get_token_new_position(game, player_id, piece_index, game.pending_roll)
 
-        skip = False
-        if new_position < 40:
-            for pid, pos in game.positions.items():
-                if pid != player_id:
-                    for i, p in enumerate(pos):
-                        if p == new_position:
-                            skip = True
-                            game.positions[pid][i] = -1
-                
-        next_player, just_won = await self._move_piece(code, player_id, piece_index, new_position)
+        # Captures happen as the move applies, on the leader as on every replica.
+        move, *events = await self._move_piece(code, player_id, piece_index, new_position)
+        kinds = {event["type"] for event in events}
 
-        return game.positions[player_id], next_player, just_won, skip
+        return move["positions"], move["next_player"], "win" in kinds, "state" in kinds
     
     
     @raft_command("clear_game")
@@ -295,23 +439,96 @@ class GameManager:
         """Clear the game data."""
         self.get_game(code)
         
-        del self.games[code]
-        
     @raft_command("start_game")
     async def start_game(self, code: str):
-        game = self.games[code]
+        game = self.get_game(code)
         if game.started:
             raise ValueError("Game has already started.")
         
-        game.started = True
-    
-        
 
     @raft_command("set_player_state")
     async def set_player_state(self, code: str, player_id: str, online: bool):
-        game = self.get_game(code)
+        if self.get_game(code).seat_of(player_id) < 0:
+            raise ValueError("Player not in game")
+
+    @raft_command("evict_games")
+    async def evict_games(self, codes: List[str], versions: List[int]):
+        """Drop games that stayed idle for idle_ttl seconds, unless they changed since `versions`."""
+
+
+class ShardedGameManager:
+    """
+    Routes every game to the GameManager shard of the Raft group owning its code.
+    Games without a code yet are created in a group this node leads.
+    """
+    def __init__(self, group_count: int, idle_ttl: float = 0, max_games: int = 0):
+        self.shards: List[GameManager] = [GameManager(group_id, idle_ttl, max_games) for group_id in range(group_count)]
+
+    def subscribe(self, listener: Callable[[str, Optional[Dict]], None]) -> None:
+        """Receive the events of every shard's games (see GameManager.listeners)."""
+        for shard in self.shards:
+            shard.listeners.append(listener)
+
+    def shard(self, code: str) -> GameManager:
+        return self.shards[group_of(code)]
+
+    def local_shards(self) -> List[GameManager]:
+        """Shards whose Raft group is led by this node, so they accept new games."""
+        shards = [self.shards[group_id] for group_id in led_groups()]
+        if not shards:
+            raise NotLeaderError("Node leads no Raft group")
+        return shards
+
+    async def create_game(self) -> GameState:
+        shard = min(self.local_shards(), key=lambda s: len(s.games))
+        return await shard.create_game()
+
+    def find_available_game(self, group_ids: List[int]) -> Optional[GameState]:
+        """The fullest open game of the given groups, from this node's replicas."""
+        games = [game for game in (self.shards[group_id].find_available_game() for group_id in group_ids) if game]
+        return max(games, key=lambda game: len(game.player_ids), default=None)
+
+    async def join_or_create_game(self, name: str, code: Optional[str] = None):
+        if code:
+            return await self.shard(code).join_or_create_game(name, code)
 
-        pid = next((i for i, p in enumerate(game.players) if p.id == player_id), 0)
-        game.players[pid].is_online = online
+        shards = self.local_shards()
+        game = self.find_available_game([shard.group_id for shard in shards])
+        shard = self.shard(game.code) if game else min(shards, key=lambda s: len(s.games))
+        return await shard.join_or_create_game(name)
 
-game_manager = GameManager()
+    def get_game(self, code: str) -> GameState:
+        return self.shard(code).get_game(code)
+
+    async def roll_dice(self, code: str, player_id: str):
+        return await self.shard(code).roll_dice(code, player_id)
+
+    async def move_piece(self, code: str, player_id: str, piece_index: int):
+        return await self.shard(code).move_piece(code, player_id, piece_index)
+
+    async def clear_game(self, code: str):
+        return await self.shard(code).clear_game(code)
+
+    async def start_game(self, code: str):
+        return await self.shard(code).start_game(code)
+
+    async def set_player_state(self, code: str, player_id: str, online: bool):
+        return await self.shard(code).set_player_state(code, player_id, online)
+
+    async def evict_idle_games(self) -> List[str]:
+        """Evict idle games from the groups this node leads. Returns the evicted codes."""
+        evicted = []
+        for group_id in led_groups():
+            shard = self.shards[group_id]
+            codes = shard.idle_games()[:EVICTION_BATCH_SIZE]
+            if codes:
+                await shard.evict_games(codes, [shard.games[code].version for code in codes])
+                evicted.extend(code for code in codes if code not in shard.games)
+        return evicted
+
+eviction_cfg = cfg.get("GAME_EVICTION") or {}
+game_manager = ShardedGameManager(
+    RAFT_GROUPS,
+    idle_ttl=eviction_cfg.get("idle_ttl", 0),
+    max_games=eviction_cfg.get("max_games", 0),
+)
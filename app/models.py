@@ -1,5 +1,8 @@
-from typing import List, Optional, Dict, Tuple, Union
+import sys
+from array import array
+from typing import Any, List, Optional, Dict, Tuple, Union
 from pydantic import BaseModel, Field
+from app.constants import MAXIMUM_ALLOWED_PLAYERS, TOKENS_PER_PLAYER, TRACK_LENGTH, START_SPACING
 
 class Player(BaseModel):
     id: str
@@ -14,10 +17,112 @@ class Game(BaseModel):
     pending_roll: Optional[int] = None
     positions: Dict[str, List[int]] = Field(default_factory=dict)
     start_offset: Dict[str, int] = {}
+    # Commands applied to the game; tags the events broadcast for it.
+    version: int = 0
 
-    def init_positions(self):
-        for player in self.players:
-            self.positions.setdefault(player.id, [-1, -1, -1, -1])
+
+class GameState:
+    """
+    Compact in-memory form of a Game, converted to one only at the API boundary.
+    Players are kept in parallel lists by seat, the positions of all tokens in
+    one byte array (seat i's tokens in slots 4i..4i+3), and the occupant of
+    every track cell in `board`, so a capture is a single lookup.
+    """
+    __slots__ = ("code", "player_ids", "names", "online", "started", "current_turn", "pending_roll", "version", "tokens", "board")
+
+    def __init__(self, code: str):
+        self.code = code
+        self.player_ids: List[str] = []
+        self.names: List[str] = []
+        self.online: List[bool] = []
+        self.started = False
+        self.current_turn = 0
+        self.pending_roll: Optional[int] = None
+        self.version = 0
+        # -1 at home, 0..39 on the track, 40..43 in the finish lane.
+        self.tokens = array("b", [-1]) * (MAXIMUM_ALLOWED_PLAYERS * TOKENS_PER_PLAYER)
+        # Track cell -> 1 + token slot of its occupant, 0 when empty.
+        self.board = bytearray(TRACK_LENGTH)
+
+    def seat_of(self, player_id: str) -> int:
+        """The player's seat, -1 if they are not in the game."""
+        try:
+            return self.player_ids.index(player_id)
+        except ValueError:
+            return -1
+
+    def add_player(self, player_id: str, name: str, online: bool = False) -> None:
+        self.player_ids.append(player_id)
+        self.names.append(name)
+        self.online.append(online)
+
+    def player(self, seat: int) -> Dict[str, Any]:
+        return {"id": self.player_ids[seat], "name": self.names[seat], "is_online": self.online[seat]}
+
+    def start_offset(self, seat: int) -> int:
+        return seat * START_SPACING
+
+    def positions_of(self, seat: int) -> List[int]:
+        return self.tokens[seat * TOKENS_PER_PLAYER:(seat + 1) * TOKENS_PER_PLAYER].tolist()
+
+    def all_positions(self) -> Dict[str, List[int]]:
+        return {player_id: self.positions_of(seat) for seat, player_id in enumerate(self.player_ids)}
+
+    def finished(self, seat: int) -> bool:
+        return all(position >= TRACK_LENGTH for position in self.positions_of(seat))
+
+    def move_token(self, seat: int, token: int, new_position: int) -> bool:
+        """Move a token, sending home an opponent on the target cell. Returns whether one was captured."""
+        slot = seat * TOKENS_PER_PLAYER + token
+        old_position = self.tokens[slot]
+        if 0 <= old_position < TRACK_LENGTH:
+            self.board[old_position] = 0
+        captured = False
+        if 0 <= new_position < TRACK_LENGTH:
+            occupant = self.board[new_position]
+            if occupant:
+                self.tokens[occupant - 1] = -1
+                captured = True
+            self.board[new_position] = slot + 1
+        self.tokens[slot] = new_position
+        return captured
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the game."""
+        size = sys.getsizeof(self) + sys.getsizeof(self.code) + sys.getsizeof(self.tokens) + sys.getsizeof(self.board)
+        for values in (self.player_ids, self.names, self.online):
+            size += sys.getsizeof(values)
+        return size + sum(sys.getsizeof(value) for value in self.player_ids + self.names)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The game in the shape of a Game, as kept in snapshots and sent to clients."""
+        return {
+            "code": self.code,
+            "players": [self.player(seat) for seat in range(len(self.player_ids))],
+            "started": self.started,
+            "current_turn": self.current_turn,
+            "pending_roll": self.pending_roll,
+            "positions": self.all_positions(),
+            "start_offset": {player_id: self.start_offset(seat) for seat, player_id in enumerate(self.player_ids)},
+            "version": self.version,
+        }
+
+    def to_model(self) -> Game:
+        return Game(**self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GameState":
+        game = cls(data["code"])
+        for player in data.get("players", []):
+            game.add_player(player["id"], player["name"], player.get("is_online", False))
+        game.started = data.get("started", False)
+        game.current_turn = data.get("current_turn", 0)
+        game.pending_roll = data.get("pending_roll")
+        game.version = data.get("version", 0)
+        for seat, player_id in enumerate(game.player_ids):
+            for token, position in enumerate(data.get("positions", {}).get(player_id, [])):
+                game.move_token(seat, token, position)
+        return game
 
 class JoinRequest(BaseModel):
     code: Optional[str] = None
@@ -33,12 +138,18 @@ class JoinResponse(BaseModel):
 class CreateGameResponse(BaseModel):
     code: str
 
+class ActionRequest(BaseModel):
+    action: str
+    token_idx: Optional[int] = None
+    online: Optional[bool] = None
+
 
 class PeerNode(BaseModel):
     id: str
     server: str
     host: str
     port: int
+    learner: bool = False
 
 class LogEntry(BaseModel):
     term: int
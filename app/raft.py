@@ -3,11 +3,16 @@ import logging
 import asyncio
 import grpc
 import json
+import zlib
 import functools
+from typing import Dict, List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from app.utils.util import load_yaml
-from app.raftnode import RaftNode, Role
+from app.models import PeerNode
+from app.raftnode import RaftNode, NotLeaderError, MembershipChangeError, GRPC_OPTIONS
+from app.storage import FileLogStore, MemoryLogStore
+from app.commands import encode_command
 from app.raft_grpc.raft_pb2 import (
     RequestVoteReply,
     AppendEntriesReply,
@@ -26,61 +31,180 @@ RAFT_NODE_ID = os.getenv("RAFT_NODE_ID", "node1")
 
 cfg = load_yaml(os.path.join(BASE_DIR, "..", "raft.yaml"))
 
+# Games are partitioned by code over independent Raft groups, each with its own
+# log, leader and GameManager shard. Changing the count re-maps existing games.
+RAFT_GROUPS: int = cfg.get("RAFT_GROUPS", 1)
+# Worker processes per node (see app/gateway.py). Worker w runs the groups with
+# group_id % RAFT_WORKERS == w and serves gRPC on the node's port + w, so the
+# workers of a group talk to each other directly on every node.
+RAFT_WORKERS: int = cfg.get("RAFT_WORKERS", 1)
+RAFT_WORKER: int = int(os.getenv("RAFT_WORKER", "0"))
+# Set on a node started to be added to a running cluster: its groups wait for the
+# leaders to add them (POST /raft/groups/{group_id}/members) instead of using RAFT_CLUSTER.
+RAFT_JOIN: bool = os.getenv("RAFT_JOIN", "0") == "1"
+
 router = APIRouter()
 
-raft_node: RaftNode = None
+raft_groups: Dict[int, RaftNode] = {}
+
+
+def group_of(code: str) -> int:
+    """Raft group owning a game code. Must match the crc32 routing in nginx.conf."""
+    return zlib.crc32(code.encode("utf-8")) % RAFT_GROUPS
+
+
+def worker_of(group_id: int) -> int:
+    """Worker process running a Raft group."""
+    return group_id % RAFT_WORKERS
+
+
+def led_groups() -> List[int]:
+    """Groups this process is currently the leader of."""
+    return [node.group_id for node in raft_groups.values() if node.is_leader()]
 
 
 class RaftGRPCServicer(RaftServicer):
     async def RequestVote(self, request, context):
-        rv = await raft_node.handle_request_vote(request)
+        rv = await raft_groups[request.group_id].handle_request_vote(request)
 
         return rv
     
     async def AppendEntries(self, request, context):
-        ae = await raft_node.handle_append_entries(request)
+        ae = await raft_groups[request.group_id].handle_append_entries(request)
 
         return ae
+
+    async def AppendEntriesStream(self, request_iterator, context):
+        # Requests are handled concurrently, like unary calls would be; the group's
+        # state lock keeps their log updates in arrival order.
+        write_lock = asyncio.Lock()
+        handlers = set()
+
+        async def handle(request):
+            reply = await raft_groups[request.group_id].handle_append_entries(request)
+            reply.request_id = request.request_id
+            async with write_lock:
+                await context.write(reply)
+
+        async for request in request_iterator:
+            task = asyncio.create_task(handle(request))
+            handlers.add(task)
+            task.add_done_callback(handlers.discard)
+        if handlers:
+            await asyncio.wait(handlers)
+
+    async def InstallSnapshot(self, request, context):
+        snap = await raft_groups[request.group_id].handle_install_snapshot(request)
+
+        return snap
+
+    async def ReadIndex(self, request, context):
+        ri = await raft_groups[request.group_id].handle_read_index(request)
+
+        return ri
     
 
 async def grpc_server():
 
-    server = grpc.aio.server()
+    server = grpc.aio.server(options=GRPC_OPTIONS)
     node = [member for member in cfg["RAFT_CLUSTER"] if member["id"] == RAFT_NODE_ID][0]
     add_RaftServicer_to_server(RaftGRPCServicer(), server)
-    server.add_insecure_port(f"{node['host']}:{node['port']}")
+    port = node['port'] + RAFT_WORKER
+    server.add_insecure_port(f"{node['host']}:{port}")
     await server.start()
-    print(f"gRPC server started on port {node['host']}:{node['port']}")
+    print(f"gRPC server started on port {node['host']}:{port}")
     await server.wait_for_termination()
 
 
-def startup_event():
+def create_storage(node_id: str, group_id: int = 0):
+    """
+    Build the Raft log store described by the RAFT_STORAGE section of raft.yaml.
+    Defaults to an in-memory log when the section is missing.
+    """
+    storage_cfg = cfg.get("RAFT_STORAGE") or {}
+    if storage_cfg.get("backend", "memory") == "memory":
+        return MemoryLogStore()
+
+    # Group 0 keeps the pre-sharding location so existing logs are picked up.
+    directory = node_id if group_id == 0 else f"{node_id}-group{group_id}"
+    data_dir = os.path.join(BASE_DIR, "..", storage_cfg.get("data_dir", "data"), directory)
+    logger.info(f"Using file log store at {data_dir}")
+    return FileLogStore(data_dir, segment_size=storage_cfg.get("segment_size", 64 * 1024 * 1024))
+
+
+def startup_event() -> Dict[int, RaftNode]:
+    from app.manager import game_manager # game state
 
     node_id = RAFT_NODE_ID
     cluster = cfg["RAFT_CLUSTER"]
-    logger.info(f"Running on Node: {node_id}")
+    logger.info(f"Running on Node: {node_id} worker {RAFT_WORKER}/{RAFT_WORKERS} with {RAFT_GROUPS} Raft groups")
     peers = [member for member in cluster if member["id"] != node_id]
-    global raft_node
+    member = next(member for member in cluster if member["id"] == node_id)
+    # Learners (read replicas) never lead, so leadership is spread over the voters only.
+    voters = [member["id"] for member in cluster if not member.get("learner")]
 
-    raft_node = RaftNode(node_id=node_id, peers=peers)
+    # One channel per peer, shared by every group, to the peer's worker running the same
+    # groups (port + RAFT_WORKER). Groups open them as they connect to new members.
+    channels: Dict[str, grpc.aio.Channel] = {}
 
-    return raft_node
+    storage_cfg = cfg.get("RAFT_STORAGE") or {}
+    replication_cfg = cfg.get("RAFT_REPLICATION") or {}
+    election_cfg = cfg.get("RAFT_ELECTION") or {}
+    raft_groups.clear()
+    for group_id in range(RAFT_GROUPS):
+        if worker_of(group_id) != RAFT_WORKER:
+            continue
+        raft_groups[group_id] = RaftNode(
+            node_id=node_id,
+            peers=peers,
+            storage=create_storage(node_id, group_id),
+            snapshot_threshold=storage_cfg.get("snapshot_threshold", 1000),
+            max_entries_per_rpc=replication_cfg.get("max_entries_per_rpc", 512),
+            max_bytes_per_rpc=replication_cfg.get("max_bytes_per_rpc", 1024 * 1024),
+            max_inflight=replication_cfg.get("max_inflight", 4),
+            batch_window=replication_cfg.get("batch_window", 0.002),
+            max_batch_size=replication_cfg.get("max_batch_size", 128),
+            lease_duration=replication_cfg.get("lease_duration", 0.0),
+            streaming=replication_cfg.get("streaming", True),
+            pre_vote=election_cfg.get("pre_vote", True),
+            check_quorum=election_cfg.get("check_quorum", True),
+            group_id=group_id,
+            state_machine=game_manager.shards[group_id],
+            channels=channels,
+            port_offset=RAFT_WORKER,
+            member=member,
+            join=RAFT_JOIN,
+            # Group g prefers the g-th voter (round robin) as its leader.
+            preferred_leader=node_id in voters and voters[group_id % len(voters)] == node_id
+        )
+
+    return raft_groups
 
 
 def raft_command(command: str):
+    """
+    Replicate a GameManager command. The decorated method only validates the
+    command against the leader's state, before it is proposed; the state
+    changes when the committed entry is applied, on the leader as on every
+    other replica. Returns what applying the entry returned, and raises
+    ValueError if the entry no longer applied (see GameManager.apply_command).
+    """
     def decorator(func):
         async def wrapper(*args, **kwargs):
             
             logger.debug(f"Executing command: {command} with args: ")
             logger.debug(json.dumps(args[1:]))
+            await func(*args, **kwargs)
+
             logger.debug("Syncing with Raft cluster...")
-            
-            entry = json.dumps({"command": command, "args": args[1:]})
-            await raft_node.append_log_entry(entry)
-                        
-            # Here we would typically wait for the Raft consensus to be reached
+            # args[0] is the GameManager shard; its group replicates the command.
+            entry = encode_command(command, *args[1:])
+            result = await raft_groups[args[0].group_id].append_log_entry(entry)
             logger.debug("Command synced with Raft cluster.")
-            return await func(*args, **kwargs)
+            if result is None:
+                # Skipped as it applied: another command changed the game first.
+                raise ValueError("The game changed meanwhile, please try again.")
+            return result
         return wrapper
     return decorator
     
@@ -90,5 +214,65 @@ def is_leader():
     """
     Handle a request for a vote in the Raft consensus algorithm.
     """
-    if raft_node.role != Role.LEADER:
+    if not led_groups():
         raise HTTPException(status_code=403, detail="Not the leader node")
+
+
+def group_raft_node(group_id: int) -> RaftNode:
+    if group_id not in raft_groups:
+        raise HTTPException(status_code=404, detail=f"Raft group {group_id} is not run by this process")
+    return raft_groups[group_id]
+
+
+def membership_view(raft_node: RaftNode) -> Dict:
+    return {
+        "group_id": raft_node.group_id,
+        "leader_id": raft_node.leadership.leader_id,
+        "index": raft_node.membership_index,
+        "members": [
+            {**member, "learner": member_id not in raft_node.voters}
+            for member_id, member in raft_node.members.items()
+        ],
+    }
+
+
+async def run_membership_change(raft_node: RaftNode, change) -> Dict:
+    try:
+        await change
+    except NotLeaderError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except MembershipChangeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return membership_view(raft_node)
+
+
+@router.get("/groups/{group_id}/members")
+def get_members(group_id: int):
+    """This node's view of a group's membership."""
+    return membership_view(group_raft_node(group_id))
+
+
+@router.post("/groups/{group_id}/members")
+async def add_member(group_id: int, member: PeerNode, request: Request):
+    """
+    Add a node to a group: it catches up as a learner and is then promoted
+    to voter, unless `learner` is set. Start the node with RAFT_JOIN=1 first.
+    Followers forward to the leader.
+    """
+    from app.utils.proxy import forward_to_leader # avoid a circular import
+    raft_node = group_raft_node(group_id)
+    response = await forward_to_leader(request, [raft_node])
+    if response is not None:
+        return response
+    return await run_membership_change(raft_node, raft_node.add_server(member.model_dump()))
+
+
+@router.delete("/groups/{group_id}/members/{node_id}")
+async def remove_member(group_id: int, node_id: str, request: Request):
+    """Remove a node from a group. Followers forward to the leader."""
+    from app.utils.proxy import forward_to_leader # avoid a circular import
+    raft_node = group_raft_node(group_id)
+    response = await forward_to_leader(request, [raft_node])
+    if response is not None:
+        return response
+    return await run_membership_change(raft_node, raft_node.remove_server(node_id))
@@ -24,23 +24,53 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nraft.proto\x12\x04raft\"c\n\x0eRequestVoteRPC\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\t\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x05\x12\x15\n\rlast_log_term\x18\x04 \x01(\x05\"M\n\x10RequestVoteReply\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0cvote_granted\x18\x02 \x01(\x08\x12\x15\n\rleader_active\x18\x03 \x01(\x08\")\n\x08LogEntry\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ommand\x18\x02 \x01(\t\"\x9a\x01\n\x10\x41ppendEntriesRPC\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x11\n\tleader_id\x18\x02 \x01(\t\x12\x16\n\x0eprev_log_index\x18\x03 \x01(\x05\x12\x15\n\rprev_log_term\x18\x04 \x01(\x05\x12\x1f\n\x07\x65ntries\x18\x05 \x03(\x0b\x32\x0e.raft.LogEntry\x12\x15\n\rleader_commit\x18\x06 \x01(\x05\"3\n\x12\x41ppendEntriesReply\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x0f\n\x07success\x18\x02 \x01(\x08\x32\x86\x01\n\x04Raft\x12\x41\n\rAppendEntries\x12\x16.raft.AppendEntriesRPC\x1a\x18.raft.AppendEntriesReply\x12;\n\x0bRequestVote\x12\x14.raft.RequestVoteRPC\x1a\x16.raft.RequestVoteReplyb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\nraft.proto\x12\x04raft\"\x87\x01\n\x0eRequestVoteRPC\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\t\x12\x16\n\x0elast_log_index\x18\x03 \x01(\x05\x12\x15\n\rlast_log_term\x18\x04 \x01(\x05\x12\x10\n\x08group_id\x18\x05 \x01(\r\x12\x10\n\x08pre_vote\x18\x06 \x01(\x08\"M\n\x10RequestVoteReply\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x14\n\x0cvote_granted\x18\x02 \x01(\x08\x12\x15\n\rleader_active\x18\x03 \x01(\x08\"G\n\x08LogEntry\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x0f\n\x07\x63ommand\x18\x02 \x01(\t\x12\x0c\n\x04\x64\x61ta\x18\x03 \x01(\x0c\x12\x0e\n\x06\x63onfig\x18\x04 \x01(\x0c\"Q\n\x06Member\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04host\x18\x02 \x01(\t\x12\x0c\n\x04port\x18\x03 \x01(\x05\x12\x0e\n\x06server\x18\x04 \x01(\t\x12\x0f\n\x07learner\x18\x05 \x01(\x08\":\n\nMembership\x12\x1d\n\x07members\x18\x01 \x03(\x0b\x32\x0c.raft.Member\x12\r\n\x05index\x18\x02 \x01(\x05\"\xd2\x02\n\x07\x43ommand\x12\'\n\x0b\x63reate_game\x18\x01 \x01(\x0b\x32\x10.raft.CreateGameH\x00\x12#\n\tjoin_game\x18\x02 \x01(\x0b\x32\x0e.raft.JoinGameH\x00\x12#\n\troll_dice\x18\x03 \x01(\x0b\x32\x0e.raft.RollDiceH\x00\x12%\n\nmove_piece\x18\x04 \x01(\x0b\x32\x0f.raft.MovePieceH\x00\x12%\n\nclear_game\x18\x05 \x01(\x0b\x32\x0f.raft.ClearGameH\x00\x12%\n\nstart_game\x18\x06 \x01(\x0b\x32\x0f.raft.StartGameH\x00\x12\x30\n\x10set_player_state\x18\x07 \x01(\x0b\x32\x14.raft.SetPlayerStateH\x00\x12\'\n\x0b\x65vict_games\x18\x08 \x01(\x0b\x32\x10.raft.EvictGamesH\x00\x42\x04\n\x02op\"\x1a\n\nCreateGame\x12\x0c\n\x04\x63ode\x18\x01 \x01(\t\"L\n\x08JoinGame\x12\x0c\n\x04\x63ode\x18\x01 \x01(\t\x12\x11\n\tplayer_id\x18\x02 \x01(\t\x12\x0c\n\x04name\x18\x03 \x01(\t\x12\x11\n\tis_online\x18\x04 \x01(\x08\"{\n\x08RollDice\x12\x0c\n\x04\x63ode\x18\x01 \x01(\t\x12\x19\n\x0cpending_roll\x18\x02 \x01(\x05H\x00\x88\x01\x01\x12\x14\n\x0c\x63urrent_turn\x18\x03 \x01(\x05\x12\x0c\n\x04roll\x18\x04 \x01(\x05\x12\x11\n\tplayer_id\x18\x05 \x01(\tB\x0f\n\r_pending_roll\"W\n\tMovePiece\x12\x0c\n\x04\x63ode\x18\x01 \x01(\t\x12\x11\n\tplayer_id\x18\x02 \x01(\t\x12\x13\n\x0bpiece_index\x18\x03 \x01(\x05\x12\x14\n\x0cnew_position\x18\x04 \x01(\x05\"\x19\n\tClearGame\x12\x0c\n\x04\x63ode\x18\x01 \x01(\t\"\x19\n\tStartGame\x12\x0c\n\x04\x63ode\x18\x01 \x01(\t\"A\n\x0eSetPlayerState\x12\x0c\n\x04\x63ode\x18\x01 \x01(\t\x12\x11\n\tplayer_id\x18\x02 \x01(\t\x12\x0e\n\x06online\x18\x03 \x01(\x08\"-\n\nEvictGames\x12\r\n\x05\x63odes\x18\x01 \x03(\t\x12\x10\n\x08versions\x18\x02 \x03(\x03\"\xc0\x01\n\x10\x41ppendEntriesRPC\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x11\n\tleader_id\x18\x02 \x01(\t\x12\x16\n\x0eprev_log_index\x18\x03 \x01(\x05\x12\x15\n\rprev_log_term\x18\x04 \x01(\x05\x12\x1f\n\x07\x65ntries\x18\x05 \x03(\x0b\x32\x0e.raft.LogEntry\x12\x15\n\rleader_commit\x18\x06 \x01(\x05\x12\x10\n\x08group_id\x18\x07 \x01(\r\x12\x12\n\nrequest_id\x18\x08 \x01(\x04\"\x8a\x01\n\x12\x41ppendEntriesReply\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x15\n\rconflict_term\x18\x03 \x01(\x05\x12\x16\n\x0e\x63onflict_index\x18\x04 \x01(\x05\x12\x12\n\nlog_length\x18\x05 \x01(\x05\x12\x12\n\nrequest_id\x18\x06 \x01(\x04\"\xb4\x01\n\x12InstallSnapshotRPC\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x11\n\tleader_id\x18\x02 \x01(\t\x12\x1b\n\x13last_included_index\x18\x03 \x01(\x05\x12\x1a\n\x12last_included_term\x18\x04 \x01(\x05\x12\x0c\n\x04\x64\x61ta\x18\x05 \x01(\x0c\x12\x10\n\x08group_id\x18\x06 \x01(\r\x12$\n\nmembership\x18\x07 \x01(\x0b\x32\x10.raft.Membership\"$\n\x14InstallSnapshotReply\x12\x0c\n\x04term\x18\x01 \x01(\x05\"1\n\x0cReadIndexRPC\x12\x0f\n\x07node_id\x18\x01 \x01(\t\x12\x10\n\x08group_id\x18\x02 \x01(\r\"C\n\x0eReadIndexReply\x12\x0c\n\x04term\x18\x01 \x01(\x05\x12\x0f\n\x07success\x18\x02 \x01(\x08\x12\x12\n\nread_index\x18\x03 \x01(\x05\x32\xd3\x02\n\x04Raft\x12\x41\n\rAppendEntries\x12\x16.raft.AppendEntriesRPC\x1a\x18.raft.AppendEntriesReply\x12K\n\x13\x41ppendEntriesStream\x12\x16.raft.AppendEntriesRPC\x1a\x18.raft.AppendEntriesReply(\x01\x30\x01\x12;\n\x0bRequestVote\x12\x14.raft.RequestVoteRPC\x1a\x16.raft.RequestVoteReply\x12G\n\x0fInstallSnapshot\x12\x18.raft.InstallSnapshotRPC\x1a\x1a.raft.InstallSnapshotReply\x12\x35\n\tReadIndex\x12\x12.raft.ReadIndexRPC\x1a\x14.raft.ReadIndexReplyb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'raft_pb2', _globals)
 if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
-  _globals['_REQUESTVOTERPC']._serialized_start=20
-  _globals['_REQUESTVOTERPC']._serialized_end=119
-  _globals['_REQUESTVOTEREPLY']._serialized_start=121
-  _globals['_REQUESTVOTEREPLY']._serialized_end=198
-  _globals['_LOGENTRY']._serialized_start=200
-  _globals['_LOGENTRY']._serialized_end=241
-  _globals['_APPENDENTRIESRPC']._serialized_start=244
-  _globals['_APPENDENTRIESRPC']._serialized_end=398
-  _globals['_APPENDENTRIESREPLY']._serialized_start=400
-  _globals['_APPENDENTRIESREPLY']._serialized_end=451
-  _globals['_RAFT']._serialized_start=454
-  _globals['_RAFT']._serialized_end=588
+  _globals['_REQUESTVOTERPC']._serialized_start=21
+  _globals['_REQUESTVOTERPC']._serialized_end=156
+  _globals['_REQUESTVOTEREPLY']._serialized_start=158
+  _globals['_REQUESTVOTEREPLY']._serialized_end=235
+  _globals['_LOGENTRY']._serialized_start=237
+  _globals['_LOGENTRY']._serialized_end=308
+  _globals['_MEMBER']._serialized_start=310
+  _globals['_MEMBER']._serialized_end=391
+  _globals['_MEMBERSHIP']._serialized_start=393
+  _globals['_MEMBERSHIP']._serialized_end=451
+  _globals['_COMMAND']._serialized_start=454
+  _globals['_COMMAND']._serialized_end=792
+  _globals['_CREATEGAME']._serialized_start=794
+  _globals['_CREATEGAME']._serialized_end=820
+  _globals['_JOINGAME']._serialized_start=822
+  _globals['_JOINGAME']._serialized_end=898
+  _globals['_ROLLDICE']._serialized_start=900
+  _globals['_ROLLDICE']._serialized_end=1023
+  _globals['_MOVEPIECE']._serialized_start=1025
+  _globals['_MOVEPIECE']._serialized_end=1112
+  _globals['_CLEARGAME']._serialized_start=1114
+  _globals['_CLEARGAME']._serialized_end=1139
+  _globals['_STARTGAME']._serialized_start=1141
+  _globals['_STARTGAME']._serialized_end=1166
+  _globals['_SETPLAYERSTATE']._serialized_start=1168
+  _globals['_SETPLAYERSTATE']._serialized_end=1233
+  _globals['_EVICTGAMES']._serialized_start=1235
+  _globals['_EVICTGAMES']._serialized_end=1280
+  _globals['_APPENDENTRIESRPC']._serialized_start=1283
+  _globals['_APPENDENTRIESRPC']._serialized_end=1475
+  _globals['_APPENDENTRIESREPLY']._serialized_start=1478
+  _globals['_APPENDENTRIESREPLY']._serialized_end=1616
+  _globals['_INSTALLSNAPSHOTRPC']._serialized_start=1619
+  _globals['_INSTALLSNAPSHOTRPC']._serialized_end=1799
+  _globals['_INSTALLSNAPSHOTREPLY']._serialized_start=1801
+  _globals['_INSTALLSNAPSHOTREPLY']._serialized_end=1837
+  _globals['_READINDEXRPC']._serialized_start=1839
+  _globals['_READINDEXRPC']._serialized_end=1888
+  _globals['_READINDEXREPLY']._serialized_start=1890
+  _globals['_READINDEXREPLY']._serialized_end=1957
+  _globals['_RAFT']._serialized_start=1960
+  _globals['_RAFT']._serialized_end=2299
 # @@protoc_insertion_point(module_scope)
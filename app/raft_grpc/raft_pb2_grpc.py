@@ -39,11 +39,26 @@ class RaftStub(object):
                 request_serializer=raft__pb2.AppendEntriesRPC.SerializeToString,
                 response_deserializer=raft__pb2.AppendEntriesReply.FromString,
                 _registered_method=True)
+        self.AppendEntriesStream = channel.stream_stream(
+                '/raft.Raft/AppendEntriesStream',
+                request_serializer=raft__pb2.AppendEntriesRPC.SerializeToString,
+                response_deserializer=raft__pb2.AppendEntriesReply.FromString,
+                _registered_method=True)
         self.RequestVote = channel.unary_unary(
                 '/raft.Raft/RequestVote',
                 request_serializer=raft__pb2.RequestVoteRPC.SerializeToString,
                 response_deserializer=raft__pb2.RequestVoteReply.FromString,
                 _registered_method=True)
+        self.InstallSnapshot = channel.unary_unary(
+                '/raft.Raft/InstallSnapshot',
+                request_serializer=raft__pb2.InstallSnapshotRPC.SerializeToString,
+                response_deserializer=raft__pb2.InstallSnapshotReply.FromString,
+                _registered_method=True)
+        self.ReadIndex = channel.unary_unary(
+                '/raft.Raft/ReadIndex',
+                request_serializer=raft__pb2.ReadIndexRPC.SerializeToString,
+                response_deserializer=raft__pb2.ReadIndexReply.FromString,
+                _registered_method=True)
 
 
 class RaftServicer(object):
@@ -56,6 +71,14 @@ class RaftServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def AppendEntriesStream(self, request_iterator, context):
+        """AppendEntriesStream carries the same messages over one long-lived call per leader and
+        follower; replies echo request_id, so several requests can be in flight at once.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def RequestVote(self, request, context):
         """RequestVote is used by candidates to gather votes from other nodes.
         """
@@ -63,6 +86,20 @@ class RaftServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def InstallSnapshot(self, request, context):
+        """InstallSnapshot brings a follower whose next entry was compacted away up to date.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ReadIndex(self, request, context):
+        """ReadIndex lets a follower ask the leader for a commit index that is safe to read at.
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_RaftServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -71,11 +108,26 @@ def add_RaftServicer_to_server(servicer, server):
                     request_deserializer=raft__pb2.AppendEntriesRPC.FromString,
                     response_serializer=raft__pb2.AppendEntriesReply.SerializeToString,
             ),
+            'AppendEntriesStream': grpc.stream_stream_rpc_method_handler(
+                    servicer.AppendEntriesStream,
+                    request_deserializer=raft__pb2.AppendEntriesRPC.FromString,
+                    response_serializer=raft__pb2.AppendEntriesReply.SerializeToString,
+            ),
             'RequestVote': grpc.unary_unary_rpc_method_handler(
                     servicer.RequestVote,
                     request_deserializer=raft__pb2.RequestVoteRPC.FromString,
                     response_serializer=raft__pb2.RequestVoteReply.SerializeToString,
             ),
+            'InstallSnapshot': grpc.unary_unary_rpc_method_handler(
+                    servicer.InstallSnapshot,
+                    request_deserializer=raft__pb2.InstallSnapshotRPC.FromString,
+                    response_serializer=raft__pb2.InstallSnapshotReply.SerializeToString,
+            ),
+            'ReadIndex': grpc.unary_unary_rpc_method_handler(
+                    servicer.ReadIndex,
+                    request_deserializer=raft__pb2.ReadIndexRPC.FromString,
+                    response_serializer=raft__pb2.ReadIndexReply.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'raft.Raft', rpc_method_handlers)
@@ -114,6 +166,33 @@ class Raft(object):
             metadata,
             _registered_method=True)
 
+    @staticmethod
+    def AppendEntriesStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(
+            request_iterator,
+            target,
+            '/raft.Raft/AppendEntriesStream',
+            raft__pb2.AppendEntriesRPC.SerializeToString,
+            raft__pb2.AppendEntriesReply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
     @staticmethod
     def RequestVote(request,
             target,
@@ -140,3 +219,57 @@ class Raft(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def InstallSnapshot(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/raft.Raft/InstallSnapshot',
+            raft__pb2.InstallSnapshotRPC.SerializeToString,
+            raft__pb2.InstallSnapshotReply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def ReadIndex(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/raft.Raft/ReadIndex',
+            raft__pb2.ReadIndexRPC.SerializeToString,
+            raft__pb2.ReadIndexReply.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -6,10 +6,15 @@ from typing import TypedDict, Dict, Union
 import random
 import time
 from enum import Enum
-from typing import Optional, Dict, List, Any, Tuple
+from typing import Optional, Dict, List, Any, Tuple, NamedTuple, Set
 from tenacity import retry, stop_after_attempt, RetryError
-from app.raft_grpc.raft_pb2 import RequestVoteRPC as PbRV, AppendEntriesRPC as PbAE, LogEntry as PbLogEntry, RequestVoteReply, AppendEntriesReply
+from app.raft_grpc.raft_pb2 import RequestVoteRPC as PbRV, AppendEntriesRPC as PbAE, RequestVoteReply, AppendEntriesReply
+from app.raft_grpc.raft_pb2 import InstallSnapshotRPC as PbIS, InstallSnapshotReply
+from app.raft_grpc.raft_pb2 import ReadIndexRPC as PbRI, ReadIndexReply
+from app.raft_grpc.raft_pb2 import Member, Membership
 from app.raft_grpc.raft_pb2_grpc import RaftStub
+from app.commands import entry_to_pb, entry_from_pb
+from app.storage import LogStore, MemoryLogStore, Snapshot
 
 
 logging.basicConfig(
@@ -18,21 +23,41 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Snapshots travel in a single InstallSnapshot message, so lift gRPC's 4 MB default.
+GRPC_MAX_MESSAGE_LENGTH = 64 * 1024 * 1024
+GRPC_OPTIONS = [
+    ("grpc.max_send_message_length", GRPC_MAX_MESSAGE_LENGTH),
+    ("grpc.max_receive_message_length", GRPC_MAX_MESSAGE_LENGTH),
+]
+
 
 class Role(Enum):
     FOLLOWER = 1
     CANDIDATE = 2
     LEADER = 3
 
+class Leadership(NamedTuple):
+    """
+    Who leads the group, as of one state change. A new tuple is published on
+    every change of role, term or leader, so the request path can read it
+    without taking state_lock; `version` tells snapshots apart.
+    """
+    version: int
+    term: int
+    role: Role
+    leader_id: Optional[str]
+
 class PeerNode(TypedDict):
     id: str
     host: str
     port: int
     server: str
+    learner: bool = False  # non-voting read replica
 
 class LogEntry(TypedDict):
     term: int
     command: Optional[str] = None
+    config: Optional[bytes] = None
 
 class RequestVoteRPC(TypedDict):
     term: int
@@ -43,67 +68,313 @@ class AppendEntriesRPC(TypedDict):
     success: bool
 
 
+class NotLeaderError(Exception):
+    """Raised when a command is proposed on, or outlives the leadership of, a non-leader node."""
+
+
+class MembershipChangeError(Exception):
+    """Raised when a membership change cannot be made (yet), e.g. while another one is in progress."""
+
+
+class ReplicationStream:
+    """
+    Long-lived AppendEntriesStream call from a leader to one follower.
+    Requests are tagged with a request_id and acks are matched back to
+    them, so pipelined requests share the call instead of each paying
+    for a unary RPC.
+    """
+    def __init__(self, stub: RaftStub):
+        self.call = stub.AppendEntriesStream()
+        self.pending: Dict[int, asyncio.Future] = {}
+        self.next_id: int = 0
+        self.closed: bool = False
+        self.write_lock: asyncio.Lock = asyncio.Lock()
+        self.reader: asyncio.Task = asyncio.create_task(self.read_replies())
+
+    async def send(self, req: PbAE, timeout: float) -> AppendEntriesReply:
+        """
+        Send one request and wait for its ack. Raises ConnectionError once the
+        stream is broken, or when the write stalls for `timeout` (a follower
+        not reading its end would otherwise hold write_lock indefinitely).
+        """
+        if self.closed:
+            raise ConnectionError("Replication stream is closed")
+        self.next_id += 1
+        req.request_id = self.next_id
+        waiter = asyncio.get_running_loop().create_future()
+        self.pending[req.request_id] = waiter
+        try:
+            try:
+                async with self.write_lock:
+                    await asyncio.wait_for(self.call.write(req), timeout=timeout)
+            except (grpc.aio.AioRpcError, grpc.aio.UsageError, asyncio.InvalidStateError) as e:
+                self.close()
+                raise ConnectionError(f"Replication stream failed: {e}")
+            except asyncio.TimeoutError:
+                self.close()
+                raise ConnectionError("Replication stream write timed out")
+            return await asyncio.wait_for(waiter, timeout=timeout)
+        finally:
+            self.pending.pop(req.request_id, None)
+
+    async def read_replies(self) -> None:
+        error: Exception = ConnectionError("Replication stream ended")
+        try:
+            while True:
+                reply = await self.call.read()
+                if reply is grpc.aio.EOF:
+                    break
+                waiter = self.pending.get(reply.request_id)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(reply)
+        except grpc.aio.AioRpcError as e:
+            error = ConnectionError(f"Replication stream failed: {e.code()}")
+        finally:
+            self.closed = True
+            for waiter in self.pending.values():
+                if not waiter.done():
+                    waiter.set_exception(error)
+
+    def close(self) -> None:
+        self.closed = True
+        self.call.cancel()
+
+
+# Defaults: seconds an election timeout is drawn from, and an RPC deadline.
+ELECTION_TIMEOUT: Tuple[float, float] = (5, 10)
+RPC_TIMEOUT: float = 2.0
+
+
 class RaftNode:
     def __init__(
             self, 
             node_id: str, 
             peers: List[PeerNode], 
-            election_timeout: Tuple[float] = (5, 10),
+            election_timeout: Tuple[float] = ELECTION_TIMEOUT,
             heartbeat_interval: float = 0.5,
-            rpc_timeout: float = 2.0
+            rpc_timeout: float = RPC_TIMEOUT,
+            storage: Optional[LogStore] = None,
+            snapshot_threshold: int = 1000,
+            max_entries_per_rpc: int = 512,
+            max_bytes_per_rpc: int = 1024 * 1024,
+            max_inflight: int = 4,
+            batch_window: float = 0.002,
+            max_batch_size: int = 128,
+            lease_duration: float = 0.0,
+            streaming: bool = True,
+            group_id: int = 0,
+            state_machine: Optional[Any] = None,
+            channels: Optional[Dict[str, grpc.aio.Channel]] = None,
+            preferred_leader: bool = False,
+            pre_vote: bool = True,
+            check_quorum: bool = True,
+            member: Optional[PeerNode] = None,
+            join: bool = False,
+            port_offset: int = 0
         ):
         
         self.node_id: str = node_id
-        self.peers: List[PeerNode] = peers
+        # Raft group this node is a member of; every RPC carries it so groups can share one gRPC server.
+        self.group_id: int = group_id
+        self.name: str = f"{node_id}/g{group_id}"
+        # Membership: `peers` are the other members, voters and learners alike; only
+        # `voters` count towards quorums. The configured cluster is where a group
+        # starts; a joining node starts alone, as a learner, and waits to be added.
+        self.member: PeerNode = member or {"id": node_id, "host": "", "port": 0, "server": ""}
+        self.peers: List[PeerNode] = []
+        self.members: Dict[str, PeerNode] = {}
+        self.voters: Set[str] = set()
+        self.membership_index: int = -1
+        # Index of the latest membership change this leader appended, see change_membership.
+        self.config_index: int = -1
+        # gRPC port shift of the peers' worker running this group (see RAFT_WORKERS).
+        self.port_offset: int = port_offset
+        self.replicators: Dict[str, asyncio.Task] = {}
         self.election_timeout: float = random.uniform(*election_timeout)
+        # No node times out sooner than this after hearing from a leader; see in_leader_lease.
+        self.min_election_timeout: float = election_timeout[0]
+        self.pre_vote: bool = pre_vote
+        self.check_quorum: bool = check_quorum
+        self.leader_since: float = 0.0
         self.heartbeat_interval: float = heartbeat_interval
         self.rpc_timeout: float = rpc_timeout
-        self.leader_id: Optional[str] = None
+        self.snapshot_threshold: int = snapshot_threshold
+        self.max_entries_per_rpc: int = max_entries_per_rpc
+        self.max_bytes_per_rpc: int = max_bytes_per_rpc
+        self.max_inflight: int = max_inflight
+        self.batch_window: float = batch_window
+        self.max_batch_size: int = max_batch_size
+        self.lease_duration: float = lease_duration
+        self.streaming: bool = streaming
+        self._leader_id: Optional[str] = None
+        self.leader_waiters: List[asyncio.Future] = []
         
-        self.role = Role.FOLLOWER   
+        self._role = Role.FOLLOWER
         self.state = []
-        self.log: List[LogEntry] = []
-        self.current_term: int = 0
-        self.voted_for: Optional[str] = None
+        # The log, current_term and voted_for survive restarts through the storage backend.
+        self.log: LogStore = storage if storage is not None else MemoryLogStore()
+        self._current_term, self._voted_for = self.log.load_state()
+        self.leadership: Leadership = Leadership(0, self._current_term, self._role, self._leader_id)
         self.commit_index: int = -1
         self.last_applied: int = -1
-        self.next_index: Dict[str, int] = {peer['id']: 0 for peer in peers}
-        self.match_index: Dict[str, int] = {peer['id']: -1 for peer in peers}
+        self.next_index: Dict[str, int] = {}
+        self.match_index: Dict[str, int] = {}
+        # Per-peer pipeline state: probing peers get one request at a time, and a
+        # bumped epoch marks replies to requests sent before a reset as stale.
+        self.probing: Dict[str, bool] = {}
+        self.pipeline_epoch: Dict[str, int] = {}
+        self.snapshot_task: Optional[asyncio.Task] = None
+        if state_machine is None:
+            from app.manager import game_manager # game state
+            state_machine = game_manager.shards[group_id]
+        self.state_machine = state_machine
+        if self.log.snapshot:
+            self.restore_snapshot(self.log.snapshot)
 
         self.last_heartbeat = self.now()
+        if preferred_leader:
+            # Time out first after a cluster start, so group leaders end up spread across nodes.
+            self.last_heartbeat -= self.election_timeout / 2
         self.heartbeat_task: Optional[asyncio.Task] = None
         self.state_lock: asyncio.Lock = asyncio.Lock()
 
-        # GRPC
-        self.channels = {
-            peer['id']: grpc.aio.insecure_channel(f"{peer['host']}:{peer['port']}")
-            for peer in peers
-        }
-        self.stubs = {pid: RaftStub(chan) for pid, chan in self.channels.items()}
+        # Commit notification: log index -> future resolved once that index commits,
+        # and one event per peer that wakes its replicator as soon as something is appended.
+        self.commit_waiters: Dict[int, asyncio.Future] = {}
+        # Proposals waiting to be appended as one batch, see flush_proposals.
+        self.proposals: List[Tuple[Any, asyncio.Future]] = []
+        self.proposals_ready: asyncio.Event = asyncio.Event()
+        self.batcher_task: Optional[asyncio.Task] = None
+
+        # Linearizable reads: when each peer last acknowledged us (send time of the
+        # acknowledged request), reads waiting for a quorum acknowledgement, and
+        # reads waiting for last_applied to reach their read index.
+        self.peer_ack_time: Dict[str, float] = {}
+        self.ack_waiters: List[Tuple[float, asyncio.Future]] = []
+        self.apply_waiters: List[Tuple[int, asyncio.Future]] = []
+        self.term_start_index: int = 0
+        self.replicate_events: Dict[str, asyncio.Event] = {}
 
+        # GRPC: channels passed in are shared with other groups and owned by the caller.
+        self.owns_channels: bool = channels is None
+        self.channels: Dict[str, grpc.aio.Channel] = channels if channels is not None else {}
+        self.stubs: Dict[str, RaftStub] = {}
+        # AppendEntries streams per peer; after a stream fails, unary calls are used until retry time.
+        self.streams: Dict[str, ReplicationStream] = {}
+        self.stream_retry_at: Dict[str, float] = {}
 
-        logger.info(f"Node {self.node_id} initialized with {len(peers)} peers")
+        membership = self.log.load_membership()
+        if membership is not None:
+            self.set_membership(Membership.FromString(membership))
+        elif not join:
+            bootstrap = {member['id']: member for member in [self.member, *peers]}
+            learners = {member_id for member_id, member in bootstrap.items() if member.get('learner')}
+            self.set_membership(self.membership_pb(bootstrap, learners))
+
+        logger.info(f"Node {self.name} initialized with {len(peers)} peers")
 
     
     def now(self) -> float:
 
         return asyncio.get_event_loop().time()
 
-    async def is_leader(self) -> bool:
-        async with self.state_lock:
-            return self.role == Role.LEADER
+    @property
+    def current_term(self) -> int:
+        return self._current_term
+
+    @property
+    def voted_for(self) -> Optional[str]:
+        return self._voted_for
+
+    @property
+    def role(self) -> Role:
+        return self._role
+
+    @role.setter
+    def role(self, role: Role) -> None:
+        self._role = role
+        self.publish_leadership()
+
+    @property
+    def leader_id(self) -> Optional[str]:
+        return self._leader_id
+
+    @leader_id.setter
+    def leader_id(self, leader_id: Optional[str]) -> None:
+        self._leader_id = leader_id
+        self.publish_leadership()
+
+    def publish_leadership(self) -> None:
+        """Replace the leadership snapshot; a single attribute store, so readers never see a torn state."""
+        if self.leadership[1:] != (self._current_term, self._role, self._leader_id):
+            self.leadership = Leadership(self.leadership.version + 1, self._current_term, self._role, self._leader_id)
+
+    async def update_term(self, term: int, voted_for: Optional[str]) -> None:
+        """Persist term and vote together before they take effect. Requires state_lock."""
+        if (term, voted_for) == (self._current_term, self._voted_for):
+            return
+        await self.log.save_state(term, voted_for)
+        if term != self._current_term:
+            # The leader hint is per term; a new term's leader is unknown until it speaks.
+            self._leader_id = None
+        self._current_term, self._voted_for = term, voted_for
+        self.publish_leadership()
+
+    def set_leader(self, leader_id: str) -> None:
+        """Record the current term's leader and wake requests waiting to be forwarded to it."""
+        self.leader_id = leader_id
+        for waiter in self.leader_waiters:
+            if not waiter.done():
+                waiter.set_result(leader_id)
+        self.leader_waiters.clear()
+
+    async def wait_for_leader(self, timeout: float) -> str:
+        """The current leader, waiting up to `timeout` seconds while an election is in progress."""
+        if self.leader_id is not None:
+            return self.leader_id
+        waiter = asyncio.get_running_loop().create_future()
+        self.leader_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout=timeout)
+        finally:
+            if waiter in self.leader_waiters:
+                self.leader_waiters.remove(waiter)
+
+    def is_leader(self) -> bool:
+        """Lock-free leadership check for the request path, see Leadership."""
+        return self.leadership.role == Role.LEADER
+
+    async def become_follower(self, term: int) -> None:
+        """
+        Step down to follower for `term`. Must be called with state_lock held.
+        Pending commit waiters are failed; their entries may still commit under
+        the next leader, in which case they are applied like any replicated entry.
+        """
+        if term > self.current_term:
+            await self.update_term(term, None)
+        self.role = Role.FOLLOWER
+        for waiter in self.commit_waiters.values():
+            if not waiter.done():
+                waiter.set_exception(NotLeaderError(f"Node {self.name} lost leadership before commit"))
+        self.commit_waiters.clear()
+        for _, waiter in self.ack_waiters:
+            if not waiter.done():
+                waiter.set_exception(NotLeaderError(f"Node {self.name} lost leadership"))
+        self.ack_waiters.clear()
 
     @retry(stop=stop_after_attempt(1))
-    async def send_request_vote(self, peer: PeerNode, log: List) -> Dict[str, Any]:
+    async def send_request_vote(self, peer: PeerNode, msg: Dict) -> Dict[str, Any]:
         """
-        Send a RequestVote RPC to a peer.
+        Send a RequestVote RPC (or a pre-vote probe) to a peer.
         """
-        logger.info(f"Node {self.node_id} sending RequestVote to {peer['id']}")
+        logger.info(f"Node {self.name} sending {'PreVote' if msg['pre_vote'] else 'RequestVote'} to {peer['id']}")
         req = PbRV(
-            term=self.current_term,
+            term=msg["term"],
             candidate_id=self.node_id,
-            last_log_index=len(log) - 1,
-            last_log_term=log[-1]['term'] if log else 0
+            last_log_index=msg["last_log_index"],
+            last_log_term=msg["last_log_term"],
+            group_id=self.group_id,
+            pre_vote=msg["pre_vote"]
         )
         reply = await self.stubs[peer['id']].RequestVote(req, timeout=3.0)
         return {"term": reply.term, "vote_granted": reply.vote_granted}
@@ -111,7 +382,7 @@ class RaftNode:
     @retry(stop=stop_after_attempt(1))
     async def send_append_entries(self, peer: PeerNode, msg: Dict, node_id: str) -> bool:
         entries = [
-            PbLogEntry(term=e["term"], command=e["command"]) for e in msg["entries"]
+            entry_to_pb(e) for e in msg["entries"]
         ]
         
         req = PbAE(
@@ -120,41 +391,99 @@ class RaftNode:
             prev_log_index=msg["prev_log_index"],
             prev_log_term=msg["prev_log_term"],
             entries=entries,
-            leader_commit=msg["leader_commit"]
+            leader_commit=msg["leader_commit"],
+            group_id=self.group_id
         )
         
-        reply = await self.stubs[peer['id']].AppendEntries(req, timeout=self.rpc_timeout)
+        reply = await self.send_on_stream(peer['id'], req)
+        if reply is None:
+            reply = await self.stubs[peer['id']].AppendEntries(req, timeout=self.rpc_timeout)
         
-        return {"term": reply.term, "success": reply.success}
+        return {
+            "term": reply.term,
+            "success": reply.success,
+            "conflict_term": reply.conflict_term,
+            "conflict_index": reply.conflict_index,
+            "log_length": reply.log_length
+        }
+
+    async def send_on_stream(self, peer_id: str, req: PbAE) -> Optional[AppendEntriesReply]:
+        """
+        Send an AppendEntries over the peer's stream, opening it if needed.
+        Returns None when the request should go out as a unary call instead:
+        streaming is off, or the stream failed recently (e.g. an older peer
+        without AppendEntriesStream). AppendEntries is idempotent, so a
+        request lost with a broken stream can safely be resent.
+        """
+        if not self.streaming or self.now() < self.stream_retry_at[peer_id]:
+            return None
+
+        stream = self.streams.get(peer_id)
+        if stream is None or stream.closed:
+            stream = self.streams[peer_id] = ReplicationStream(self.stubs[peer_id])
+        try:
+            return await stream.send(req, timeout=self.rpc_timeout)
+        except ConnectionError as e:
+            logger.info(f"Node {self.name} falling back to unary AppendEntries for {peer_id}: {e}")
+            stream.close()
+            self.streams.pop(peer_id, None)
+            self.stream_retry_at[peer_id] = self.now() + self.rpc_timeout
+            return None
+
+    @retry(stop=stop_after_attempt(1))
+    async def send_install_snapshot(self, peer: PeerNode, snapshot: Snapshot, term: int) -> Dict[str, Any]:
+        req = PbIS(
+            term=term,
+            leader_id=self.node_id,
+            last_included_index=snapshot.index,
+            last_included_term=snapshot.term,
+            data=snapshot.data,
+            group_id=self.group_id,
+            membership=self.current_membership()
+        )
+        # A snapshot can be much larger than a batch of entries; give it more time.
+        reply = await self.stubs[peer['id']].InstallSnapshot(req, timeout=self.rpc_timeout * 5)
+
+        return {"term": reply.term}
     
     async def handle_request_vote(self, msg: RequestVoteRPC):
         """
         Handle a RequestVote RPC.
+        While we still hear from a live leader, votes and pre-votes are refused
+        without adopting the candidate's term, so a node that merely lost
+        contact for a while cannot depose a healthy leader. A pre-vote never
+        changes our term or vote.
         """
         async with self.state_lock:
-            logger.info(f"Node {self.node_id} [{self.role}] handling RequestVote from {msg.candidate_id} for term {msg.term}")
+            logger.info(f"Node {self.name} [{self.role}] handling {'PreVote' if msg.pre_vote else 'RequestVote'} from {msg.candidate_id} for term {msg.term}")
             if msg.term < self.current_term:
                 return RequestVoteReply(term=self.current_term, vote_granted=False)
-            
-            if msg.term > self.current_term:
-                self.current_term = msg.term
-                self.role = Role.FOLLOWER
-                self.voted_for = None
-                logger.info(f"Node {self.node_id} updated term to {self.current_term}, became FOLLOWER")
 
-        
+            # Pre-votes are refused while a leader is alive even without check_quorum:
+            # granting one costs us nothing, but would let the candidate depose it.
+            if (self.check_quorum or msg.pre_vote) and self.in_leader_lease():
+                logger.info(f"Node {self.name} ignored vote request from {msg.candidate_id}: leader {self.leader_id} is alive")
+                return RequestVoteReply(term=self.current_term, vote_granted=False)
+
             our_last_index = len(self.log) - 1
-            our_last_term = self.log[our_last_index]['term'] if our_last_index >= 0 else 0
+            our_last_term = self.log.last_term()
             up_to_date = (
                 msg.last_log_term > our_last_term or
                 (msg.last_log_term == our_last_term and msg.last_log_index >= our_last_index)
             )
 
+            if msg.pre_vote:
+                return RequestVoteReply(term=self.current_term, vote_granted=msg.term > self.current_term and up_to_date)
+
+            if msg.term > self.current_term:
+                await self.become_follower(msg.term)
+                logger.info(f"Node {self.name} updated term to {self.current_term}, became FOLLOWER")
+
             vote_granted = False
             if (self.voted_for is None or self.voted_for == msg.candidate_id) and up_to_date:
-                self.voted_for = msg.candidate_id
+                await self.update_term(self.current_term, msg.candidate_id)
                 vote_granted = True
-                logger.info(f"Node {self.node_id} granted vote to {msg.candidate_id}")
+                logger.info(f"Node {self.name} granted vote to {msg.candidate_id}")
         
             return RequestVoteReply(term=self.current_term, vote_granted=vote_granted)
         
@@ -162,73 +491,207 @@ class RaftNode:
     async def handle_append_entries(self, msg: PbAE) -> Dict[str, Any]:
         """
         Handle incoming AppendEntries RPC; replication and heartbeat.
+        Success is only reported once the new entries are durable.
         """ 
         async with self.state_lock:
             if msg.term < self.current_term:
                 return AppendEntriesReply(term=self.current_term, success=False)
             
-            self.current_term = msg.term
-            self.leader_id = msg.leader_id
-            self.role = Role.FOLLOWER
+            await self.become_follower(msg.term)
+            self.set_leader(msg.leader_id)
             self.last_heartbeat = self.now()
-            self.voted_for = None
 
-            if msg.prev_log_index >= 0:
-                if msg.prev_log_index >= len(self.log) or self.log[msg.prev_log_index]["term"] != msg.prev_log_term:
-                    logger.info(f"Node {self.node_id} rejected AppendEntries: prev_log_index {msg.prev_log_index} mismatch")
-                    return AppendEntriesReply(term=self.current_term, success=False)
+            if msg.prev_log_index >= len(self.log):
+                logger.info(f"Node {self.name} rejected AppendEntries: missing prev_log_index {msg.prev_log_index}")
+                return AppendEntriesReply(
+                    term=self.current_term,
+                    success=False,
+                    conflict_index=len(self.log),
+                    log_length=len(self.log)
+                )
+            # Anything at or below the snapshot index is committed and therefore matches.
+            if msg.prev_log_index > self.log.snapshot_index and self.log.term_at(msg.prev_log_index) != msg.prev_log_term:
+                conflict_term = self.log.term_at(msg.prev_log_index)
+                logger.info(f"Node {self.name} rejected AppendEntries: prev_log_index {msg.prev_log_index} mismatch")
+                return AppendEntriesReply(
+                    term=self.current_term,
+                    success=False,
+                    conflict_term=conflict_term,
+                    conflict_index=self.log.first_index_of_term(conflict_term),
+                    log_length=len(self.log)
+                )
             
-            new_entries = [{"term": e.term, "command": e.command} for e in msg.entries]
-            self.log = self.log[:msg.prev_log_index + 1] + new_entries
+            # Skip entries we already hold; only a term conflict truncates the log.
+            for offset, e in enumerate(msg.entries):
+                index = msg.prev_log_index + 1 + offset
+                if index <= self.log.snapshot_index:
+                    continue
+                if index < len(self.log):
+                    if self.log[index]["term"] == e.term:
+                        continue
+                    self.log.truncate(index)
+                self.log.extend([entry_from_pb(e) for e in msg.entries[offset:]])
+                break
+
+            last_new_index = msg.prev_log_index + len(msg.entries)
             if msg.leader_commit > self.commit_index:
-                self.commit_index = min(msg.leader_commit, len(self.log) - 1)
+                self.commit_index = max(self.commit_index, min(msg.leader_commit, last_new_index))
                 await self.apply_entries()
             
-            #logger.info(f"Node {self.node_id} accepted AppendEntries, new log length: {len(self.log)}")
+            #logger.info(f"Node {self.name} accepted AppendEntries, new log length: {len(self.log)}")
+            reply = AppendEntriesReply(term=self.current_term, success=True)
 
-            return AppendEntriesReply(term=self.current_term, success=True)
+        await self.log.sync()
+        return reply
+
+    async def handle_install_snapshot(self, msg: PbIS) -> InstallSnapshotReply:
+        """
+        Handle incoming InstallSnapshot RPC: replace the state machine and
+        the covered log prefix with the leader's snapshot.
+        """
+        async with self.state_lock:
+            if msg.term < self.current_term:
+                return InstallSnapshotReply(term=self.current_term)
+
+            await self.become_follower(msg.term)
+            self.set_leader(msg.leader_id)
+            self.last_heartbeat = self.now()
+
+            if msg.last_included_index <= self.last_applied:
+                return InstallSnapshotReply(term=self.current_term)
+
+            snapshot = Snapshot(msg.last_included_index, msg.last_included_term, msg.data)
+            await asyncio.to_thread(self.log.write_snapshot, snapshot)
+            self.log.compact(snapshot)
+            self.restore_snapshot(snapshot)
+            if msg.HasField("membership") and msg.membership.index > self.membership_index:
+                await self.apply_membership(msg.membership)
+            logger.info(f"Node {self.name} installed snapshot up to index {snapshot.index} from {msg.leader_id}")
+
+            return InstallSnapshotReply(term=self.current_term)
 
     # --------------------------------------------------------------------------
     # Leader election
     # --------------------------------------------------------------------------
 
+    def in_leader_lease(self) -> bool:
+        """
+        Whether a leader is known to be alive: as leader, a majority acknowledged
+        us within the minimum election timeout; as follower, the leader's last
+        heartbeat is that recent. Requires state_lock.
+        """
+        if self.role == Role.LEADER:
+            return self.now() - max(self.quorum_ack_time(), self.leader_since) < self.min_election_timeout
+        return self.leader_id is not None and self.now() - self.last_heartbeat < self.min_election_timeout
+
     async def start_election(self) -> None:
         """
-        Transition to candidate and solicit votes from peers.
+        Transition to candidate and solicit votes from all peers concurrently.
+        With pre_vote on, a pre-vote round at the next term comes first and the
+        term is only bumped once a majority would vote for us, so a partitioned
+        or overloaded node cannot force an election by rejoining with a higher term.
         """
         async with self.state_lock:
             if self.role == Role.LEADER:
                 return
-            
+            term = self.current_term
+            last_heartbeat = self.last_heartbeat
+            msg = {
+                "term": term + 1,
+                "last_log_index": len(self.log) - 1,
+                "last_log_term": self.log.last_term(),
+                "pre_vote": True
+            }
+
+        if self.pre_vote:
+            logger.info(f"Node {self.name} started pre-vote for term {term + 1}")
+            if not await self.collect_votes(msg):
+                logger.info(f"Node {self.name} failed pre-vote for term {term + 1}")
+                return
+
+        async with self.state_lock:
+            if self.role == Role.LEADER or self.current_term != term or self.last_heartbeat != last_heartbeat:
+                # Heard from a leader or moved to a newer term during the pre-vote.
+                return
+
             self.role = Role.CANDIDATE
-            self.current_term += 1
-            self.voted_for = self.node_id
-            
-            logger.info(f"Node {self.node_id} started election for term {self.current_term}")
+            await self.update_term(self.current_term + 1, self.node_id)
+            term = self.current_term
+            msg = {**msg, "term": term, "pre_vote": False}
+
+            logger.info(f"Node {self.name} started election for term {self.current_term}")
+
+        elected = await self.collect_votes(msg)
 
-        votes = 1  # vote for self
-        for peer in self.peers:
-            try:
-                reply = await self.send_request_vote(peer, self.log)
-                if reply.get("vote_granted"):
-                    votes += 1
-            except RetryError as e:
-                logger.info(f"Node {self.node_id} failed to get vote from {peer['id']}: {e}")
-                continue
-            
         async with self.state_lock:
+            if self.role != Role.CANDIDATE or self.current_term != term:
+                # Another leader was discovered or a newer election started meanwhile.
+                return
             # Become leader on majority
-            if votes > len(self.peers) // 2:
-                self.role = Role.LEADER
-                logger.info(f"Node {self.node_id} became LEADER with {votes} votes in term {self.current_term}")
-                for p in self.peers:
-                    self.next_index[p['id']] = len(self.log)
-                    self.match_index[p['id']] = -1
-                if self.heartbeat_task:
-                    self.heartbeat_task.cancel()
-                self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
+            if elected:
+                self.become_leader()
+                logger.info(f"Node {self.name} became LEADER in term {self.current_term}")
             else:
-                logger.info(f"Node {self.node_id} failed election with {votes} votes")
+                logger.info(f"Node {self.name} failed election in term {self.current_term}")
+
+    async def collect_votes(self, msg: Dict) -> bool:
+        """
+        Send `msg` to all peers concurrently and report whether a majority,
+        counting ourselves, granted it. Decided as soon as a majority has
+        answered yes; outstanding requests are cancelled at that point.
+        A reply with a higher term makes us a follower of that term.
+        """
+        votes = 1  # vote for self
+        majority = self.quorum_size()
+        requests = {
+            asyncio.create_task(self.send_request_vote(peer, msg)): peer
+            for peer in self.voter_peers()
+        }
+        try:
+            pending = set(requests)
+            while pending and votes < majority:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    try:
+                        reply = task.result()
+                    except RetryError as e:
+                        logger.info(f"Node {self.name} failed to get vote from {requests[task]['id']}: {e}")
+                        continue
+
+                    if reply["term"] > self.current_term:
+                        async with self.state_lock:
+                            if reply["term"] > self.current_term:
+                                await self.become_follower(reply["term"])
+                                logger.info(f"Node {self.name} abandoned election, saw higher term {reply['term']}")
+                        return False
+                    if reply.get("vote_granted"):
+                        votes += 1
+        finally:
+            for task in requests:
+                task.cancel()
+        return votes >= majority
+
+    def become_leader(self) -> None:
+        """Take over as leader for the current term. Must be called with state_lock held."""
+        self.role = Role.LEADER
+        self.set_leader(self.node_id)
+        self.leader_since = self.now()
+        self.config_index = -1
+        for p in self.peers:
+            self.next_index[p['id']] = len(self.log)
+            self.match_index[p['id']] = -1
+            self.probing[p['id']] = True
+            self.peer_ack_time[p['id']] = 0.0
+
+        # Commit a no-op from our own term right away: it commits whatever earlier
+        # leaders left behind and tells us the latest commit index for reads (Raft §8).
+        self.log.append({"term": self.current_term, "command": ""})
+        self.term_start_index = len(self.log) - 1
+
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+        self.heartbeat_task = asyncio.create_task(self.send_heartbeats())
+        asyncio.create_task(self.flush_log())
 
     # --------------------------------------------------------------------------
     # Heartbeats & log replication
@@ -238,47 +701,217 @@ class RaftNode:
     async def send_heartbeats(self) -> None:
         """
         Leader continuously sends AppendEntries (even empty) to maintain authority.
+        Each peer gets its own replicator task so a slow or dead follower never
+        delays the others; this task lives as long as the leadership term.
+        Peers added during the term get theirs from add_peer.
         """
-        
-        while self.role == Role.LEADER:
-            async with self.state_lock: 
-                for peer in self.peers:
-                    prev_idx = self.next_index[peer['id']] - 1
-                    prev_term = self.log[prev_idx]['term'] if prev_idx >= 0 else 0
-                    entries = self.log[self.next_index[peer['id']]:]
-                    msg = {
-                        "term": self.current_term,
-                        "leader_id": self.node_id,
-                        "prev_log_index": prev_idx,
-                        "prev_log_term": prev_term,
-                        "entries": entries,
-                        "leader_commit": self.commit_index
-                    }
-                    
+        term = self.current_term
+        replicators = self.replicators = {peer['id']: asyncio.create_task(self.replicate_to(peer, term)) for peer in self.peers}
+        try:
+            await self.watch_quorum(term)
+        finally:
+            for task in replicators.values():
+                task.cancel()
+
+    async def watch_quorum(self, term: int) -> None:
+        """
+        Return once the leadership term ends. With check_quorum, step down once
+        a majority has not acknowledged us for a minimum election timeout.
+        Followers refuse votes for that long after a heartbeat, so a leader cut
+        off from the majority stops accepting writes (and serving lease reads)
+        before a new leader can be elected.
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            async with self.state_lock:
+                if self.role != Role.LEADER or self.current_term != term:
+                    return
+                if self.check_quorum and not self.in_leader_lease():
+                    logger.warning(f"Node {self.name} lost contact with a majority, stepping down in term {term}")
+                    await self.become_follower(term)
+                    self.leader_id = None
+                    self.last_heartbeat = self.now()
+                    return
+
+    def trigger_replication(self) -> None:
+        """Wake every replicator so new entries go out without waiting for the next heartbeat."""
+        for event in self.replicate_events.values():
+            event.set()
+
+    async def replicate_to(self, peer: PeerNode, term: int) -> None:
+        """
+        Replicate the log to a single peer for as long as we lead `term`.
+
+        Entries go out in bounded chunks. While the peer's position is unknown
+        (after election, a rejection or an RPC error) one probe is sent at a time;
+        once a probe succeeds, up to max_inflight chunks are pipelined and
+        next_index advances optimistically ahead of match_index.
+        The state lock is only held to build a request and to apply its reply,
+        never across the RPC itself.
+        """
+        peer_id = peer['id']
+        event = self.replicate_events[peer_id]
+        window = asyncio.Semaphore(self.max_inflight)
+        inflight = set()
+
+        try:
+            while True:
+                event.clear()
+                await window.acquire()
+                async with self.state_lock:
+                    if self.role != Role.LEADER or self.current_term != term:
+                        window.release()
+                        return
+                    if self.next_index[peer_id] <= self.log.snapshot_index:
+                        snapshot = self.log.snapshot
+                    else:
+                        snapshot = None
+                        prev_idx = self.next_index[peer_id] - 1
+                        entries = self.entries_batch(self.next_index[peer_id])
+                        msg = {
+                            "term": term,
+                            "leader_id": self.node_id,
+                            "prev_log_index": prev_idx,
+                            "prev_log_term": self.log.term_at(prev_idx),
+                            "entries": entries,
+                            "leader_commit": self.commit_index
+                        }
+                        self.next_index[peer_id] += len(entries)
+                        probing = self.probing[peer_id]
+                        epoch = self.pipeline_epoch[peer_id]
+
+                if snapshot is not None:
                     try:
-                        reply = await self.send_append_entries(peer, msg, self.node_id)
-                      
-                        if reply.get("term") > self.current_term:
-                            self.current_term = reply["term"]
-                            self.role = Role.FOLLOWER
-                            self.voted_for = None
-                            logger.info(f"Node {self.node_id} stepped down to FOLLOWER due to higher term {reply['term']}")
-                            return
-                        
-                        if reply.get("success"):
-                            if entries:
-                                self.match_index[peer['id']] = prev_idx + len(entries)
-                                self.next_index[peer['id']] = self.match_index[peer['id']] + 1
-                                logger.info(f"Node {self.node_id} replicated to {peer['id']}, match_index: {self.match_index[peer['id']]}")
-                        else:
-                            self.next_index[peer['id']] = max(0, self.next_index[peer['id']] - 1)
-                            logger.info(f"Node {self.node_id} reduced next_index for {peer['id']} to {self.next_index[peer['id']]}")
-                        
-                    except RetryError as e:
-                            
-                        continue
-                                        
-            await asyncio.sleep(self.heartbeat_interval)    
+                        await self.install_snapshot_on(peer, snapshot, term)
+                    finally:
+                        window.release()
+                    continue
+
+                request = self.replicate_batch(peer, msg, term, epoch, window)
+                if probing:
+                    await request
+                else:
+                    task = asyncio.create_task(request)
+                    inflight.add(task)
+                    task.add_done_callback(inflight.discard)
+
+                if self.role == Role.LEADER and self.next_index[peer_id] < len(self.log):
+                    continue
+                try:
+                    await asyncio.wait_for(event.wait(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in inflight:
+                task.cancel()
+
+    def entries_batch(self, start: int) -> List[LogEntry]:
+        """Entries from `start`, capped by max_entries_per_rpc and max_bytes_per_rpc (never empty if any are pending)."""
+        batch = self.log[start:start + self.max_entries_per_rpc]
+        size = 0
+        for count, entry in enumerate(batch):
+            size += len(entry["command"])
+            if size > self.max_bytes_per_rpc and count > 0:
+                return batch[:count]
+        return batch
+
+    async def replicate_batch(self, peer: PeerNode, msg: Dict, term: int, epoch: int, window: asyncio.Semaphore) -> None:
+        """Send one AppendEntries to a peer and fold the reply into its replication progress."""
+        peer_id = peer['id']
+        prev_idx = msg["prev_log_index"]
+        sent_at = self.now()
+        try:
+            try:
+                reply = await self.send_append_entries(peer, msg, self.node_id)
+            except RetryError:
+                async with self.state_lock:
+                    if self.pipeline_epoch[peer_id] == epoch and self.role == Role.LEADER:
+                        # Unknown outcome: fall back to probing from the last confirmed index.
+                        self.pipeline_epoch[peer_id] += 1
+                        self.probing[peer_id] = True
+                        self.next_index[peer_id] = self.match_index[peer_id] + 1
+                await asyncio.sleep(self.heartbeat_interval)
+                return
+
+            async with self.state_lock:
+                if self.role != Role.LEADER or self.current_term != term:
+                    return
+
+                if reply["term"] > self.current_term:
+                    await self.become_follower(reply["term"])
+                    logger.info(f"Node {self.name} stepped down to FOLLOWER due to higher term {reply['term']}")
+                    return
+
+                # Any same-term reply means the peer accepted our leadership as of sent_at.
+                self.record_ack(peer_id, sent_at)
+
+                if reply["success"]:
+                    self.match_index[peer_id] = max(self.match_index[peer_id], prev_idx + len(msg["entries"]))
+                    if self.pipeline_epoch[peer_id] == epoch:
+                        self.probing[peer_id] = False
+                        self.next_index[peer_id] = max(self.next_index[peer_id], self.match_index[peer_id] + 1)
+                    if msg["entries"]:
+                        logger.info(f"Node {self.name} replicated to {peer_id}, match_index: {self.match_index[peer_id]}")
+                        await self.advance_commit_index()
+                elif self.pipeline_epoch[peer_id] == epoch:
+                    # Requests pipelined behind this one were built on the same wrong guess; ignore their replies.
+                    self.pipeline_epoch[peer_id] += 1
+                    self.probing[peer_id] = True
+                    self.next_index[peer_id] = self.backtrack_index(reply, prev_idx)
+                    logger.info(f"Node {self.name} reduced next_index for {peer_id} to {self.next_index[peer_id]}")
+        finally:
+            window.release()
+
+    def backtrack_index(self, reply: Dict[str, Any], prev_idx: int) -> int:
+        """
+        Pick the next index to try after a rejected AppendEntries, using the
+        follower's conflict hints to skip a whole term (or its missing tail) at once.
+        """
+        if reply["conflict_term"]:
+            last = self.log.last_index_of_term(reply["conflict_term"])
+            next_index = last + 1 if last >= 0 else reply["conflict_index"]
+        else:
+            next_index = min(reply["conflict_index"], reply["log_length"])
+        # Never move forward past the rejected probe.
+        return max(min(next_index, prev_idx), 0)
+
+    async def install_snapshot_on(self, peer: PeerNode, snapshot: Snapshot, term: int) -> None:
+        """Ship our snapshot to a peer whose next entry has been compacted away."""
+        peer_id = peer['id']
+        logger.info(f"Node {self.name} sending snapshot up to index {snapshot.index} to {peer_id}")
+        try:
+            reply = await self.send_install_snapshot(peer, snapshot, term)
+        except RetryError:
+            await asyncio.sleep(self.heartbeat_interval)
+            return
+
+        async with self.state_lock:
+            if reply["term"] > self.current_term:
+                await self.become_follower(reply["term"])
+                logger.info(f"Node {self.name} stepped down to FOLLOWER due to higher term {reply['term']}")
+                return
+            if self.role == Role.LEADER and self.current_term == term:
+                self.match_index[peer_id] = max(self.match_index[peer_id], snapshot.index)
+                self.next_index[peer_id] = max(self.next_index[peer_id], snapshot.index + 1)
+
+    async def advance_commit_index(self) -> None:
+        """
+        Move commit_index to the highest index stored on a majority and apply it.
+        Must be called with state_lock held by the leader.
+        """
+        replicated = sorted(
+            [self.log.durable_index if peer_id == self.node_id else self.match_index[peer_id] for peer_id in self.voters],
+            reverse=True
+        )
+        majority_index = replicated[self.quorum_size() - 1]
+
+        # Only entries from the current term are committed by counting replicas (Raft §5.4.2).
+        if majority_index <= self.commit_index or self.log.term_at(majority_index) != self.current_term:
+            return
+
+        self.commit_index = majority_index
+        logger.info(f"Node {self.name} committed log entries up to index {majority_index}")
+        await self.apply_entries()
 
 
     # --------------------------------------------------------------------------
@@ -287,14 +920,305 @@ class RaftNode:
 
     async def apply_entries(self) -> None:
         """
-        Apply all newly committed log entries to the in-memory state dict.
+        Apply all newly committed log entries to the state machine, in log order
+        and on every node alike. Entries proposed on this node hand the result
+        of applying them back to their waiting caller.
         """
-        from app.manager import game_manager # game state
         logger.info("Applying committed entries")
         while self.last_applied < self.commit_index:
             self.last_applied += 1
             entry = self.log[self.last_applied]
-            game_manager.apply_command(entry["command"])
+            waiter = self.commit_waiters.pop(self.last_applied, None)
+            if entry.get("config") and self.last_applied > self.membership_index:
+                # Membership changes take effect in Raft itself, whoever proposed them.
+                membership = Membership.FromString(entry["config"])
+                membership.index = self.last_applied
+                await self.apply_membership(membership)
+            result = None
+            if entry["command"]:
+                try:
+                    result = self.state_machine.apply_command(entry["command"])
+                except Exception as e:
+                    # Every replica fails the same way on the same entry; keep applying the rest.
+                    logger.exception(f"Node {self.name} failed to apply log entry {self.last_applied}: {e}")
+                    if waiter is not None and not waiter.done():
+                        waiter.set_exception(e)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(result)
+        self.notify_applied()
+
+        if self.last_applied - self.log.snapshot_index >= self.snapshot_threshold and not self.snapshot_task:
+            # Run as a separate task, as it takes the state_lock held by the caller.
+            self.snapshot_task = asyncio.create_task(self.take_snapshot())
+
+    async def take_snapshot(self) -> None:
+        """Snapshot the game state at last_applied and compact the log behind it."""
+        try:
+            async with self.state_lock:
+                index = self.last_applied
+                if index <= self.log.snapshot_index:
+                    return
+                snapshot = Snapshot(index, self.log.term_at(index), self.state_machine.snapshot())
+                await asyncio.to_thread(self.log.write_snapshot, snapshot)
+                self.log.compact(snapshot)
+                logger.info(f"Node {self.name} compacted log up to index {index}")
+        finally:
+            self.snapshot_task = None
+
+    def restore_snapshot(self, snapshot: Snapshot) -> None:
+        """Reset the state machine to `snapshot`. Must be called with state_lock held (or before start)."""
+        self.state_machine.restore(snapshot.data)
+        self.commit_index = max(self.commit_index, snapshot.index)
+        self.last_applied = snapshot.index
+        self.notify_applied()
+
+    def notify_applied(self) -> None:
+        """Wake reads waiting for last_applied to reach their read index."""
+        remaining = []
+        for index, waiter in self.apply_waiters:
+            if index <= self.last_applied:
+                if not waiter.done():
+                    waiter.set_result(None)
+            else:
+                remaining.append((index, waiter))
+        self.apply_waiters = remaining
+
+    # --------------------------------------------------------------------------
+    # Linearizable reads (ReadIndex)
+    # --------------------------------------------------------------------------
+
+    def quorum_ack_time(self) -> float:
+        """Latest time as of which a majority of the voters, counting ourselves, is known to follow us."""
+        times = sorted(
+            [self.now() if peer_id == self.node_id else self.peer_ack_time[peer_id] for peer_id in self.voters],
+            reverse=True
+        )
+        return times[self.quorum_size() - 1]
+
+    def record_ack(self, peer_id: str, sent_at: float) -> None:
+        """Note a peer's acknowledgement and release reads waiting for a quorum. Requires state_lock."""
+        self.peer_ack_time[peer_id] = max(self.peer_ack_time[peer_id], sent_at)
+        if not self.ack_waiters:
+            return
+        quorum_time = self.quorum_ack_time()
+        remaining = []
+        for since, waiter in self.ack_waiters:
+            if quorum_time >= since:
+                if not waiter.done():
+                    waiter.set_result(None)
+            else:
+                remaining.append((since, waiter))
+        self.ack_waiters = remaining
+
+    async def read_index(self) -> int:
+        """
+        Leader side of ReadIndex: return an index such that serving a read once
+        it has been applied is linearizable. Leadership is confirmed with a
+        heartbeat round, unless a majority acknowledged us within lease_duration.
+        """
+        async with self.state_lock:
+            if self.role != Role.LEADER:
+                raise NotLeaderError("Not the leader")
+            read_index = max(self.commit_index, self.term_start_index)
+            since = self.now()
+            if self.lease_duration > 0 and since - self.quorum_ack_time() < self.lease_duration:
+                return read_index
+            if self.quorum_ack_time() >= since:
+                return read_index
+            confirmed = asyncio.get_running_loop().create_future()
+            self.ack_waiters.append((since, confirmed))
+
+        self.trigger_replication()
+        try:
+            await asyncio.wait_for(confirmed, timeout=self.rpc_timeout)
+        except asyncio.TimeoutError:
+            raise NotLeaderError("Could not confirm leadership with a majority")
+        return read_index
+
+    async def wait_applied(self, index: int) -> None:
+        if self.last_applied >= index:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.apply_waiters.append((index, waiter))
+        await waiter
+
+    @retry(stop=stop_after_attempt(1))
+    async def request_read_index(self, leader_id: str) -> Dict[str, Any]:
+        reply = await self.stubs[leader_id].ReadIndex(PbRI(node_id=self.node_id, group_id=self.group_id), timeout=self.rpc_timeout)
+
+        return {"term": reply.term, "success": reply.success, "read_index": reply.read_index}
+
+    async def handle_read_index(self, msg: PbRI) -> ReadIndexReply:
+        """Handle a follower's ReadIndex request."""
+        try:
+            index = await self.read_index()
+        except NotLeaderError:
+            return ReadIndexReply(term=self.current_term, success=False)
+        # Make sure the follower learns the commit index promptly, even on the lease path.
+        self.trigger_replication()
+        return ReadIndexReply(term=self.current_term, success=True, read_index=index)
+
+    async def read_barrier(self) -> None:
+        """
+        Wait until this node's state machine reflects every write committed
+        before the call, so a local read is linearizable. Works on the leader
+        and on followers, which ask the leader for its read index.
+        """
+        if self.role == Role.LEADER:
+            index = await self.read_index()
+        else:
+            leader_id = self.leader_id
+            if leader_id is None or leader_id not in self.stubs:
+                raise NotLeaderError("No known leader to confirm the read")
+            try:
+                reply = await self.request_read_index(leader_id)
+            except RetryError:
+                raise NotLeaderError(f"Leader {leader_id} is unreachable")
+            if not reply["success"]:
+                raise NotLeaderError(f"Node {leader_id} is no longer the leader")
+            index = reply["read_index"]
+
+        await asyncio.wait_for(self.wait_applied(index), timeout=self.rpc_timeout)
+
+    # --------------------------------------------------------------------------
+    # Membership changes
+    # --------------------------------------------------------------------------
+
+    def quorum_size(self) -> int:
+        return len(self.voters) // 2 + 1
+
+    def voter_peers(self) -> List[PeerNode]:
+        return [peer for peer in self.peers if peer['id'] in self.voters]
+
+    def membership_pb(self, members: Dict[str, PeerNode], learners: Set[str], index: int = 0) -> Membership:
+        return Membership(
+            members=[
+                Member(id=m['id'], host=m['host'], port=m['port'], server=m['server'], learner=m['id'] in learners)
+                for m in members.values()
+            ],
+            index=index
+        )
+
+    def current_membership(self) -> Membership:
+        return self.membership_pb(self.members, set(self.members) - self.voters, self.membership_index)
+
+    async def apply_membership(self, membership: Membership) -> None:
+        """
+        Switch to a committed membership and persist it. A leader that is no
+        longer a voter steps down. Requires state_lock.
+        """
+        self.set_membership(membership)
+        await self.log.save_membership(membership.SerializeToString())
+        if self.role == Role.LEADER and self.node_id not in self.voters:
+            logger.info(f"Node {self.name} removed from the voters, stepping down")
+            await self.become_follower(self.current_term)
+            self.leader_id = None
+
+    def set_membership(self, membership: Membership) -> None:
+        """
+        Switch to a membership in memory: connect to new peers (and start
+        replicating to them when leading), drop removed ones.
+        """
+        members = {m.id: {"id": m.id, "host": m.host, "port": m.port, "server": m.server} for m in membership.members}
+        for peer_id in set(self.members) - set(members) - {self.node_id}:
+            self.remove_peer(peer_id)
+        for peer_id, peer in members.items():
+            if peer_id != self.node_id and peer_id not in self.members:
+                self.add_peer(peer)
+
+        self.members = members
+        self.peers = [peer for peer_id, peer in members.items() if peer_id != self.node_id]
+        self.voters = {m.id for m in membership.members if not m.learner}
+        self.membership_index = membership.index
+        logger.info(f"Node {self.name} membership at index {membership.index}: voters {sorted(self.voters)}, learners {sorted(set(members) - self.voters)}")
+
+    def add_peer(self, peer: PeerNode) -> None:
+        peer_id = peer['id']
+        if peer_id not in self.channels:
+            self.channels[peer_id] = grpc.aio.insecure_channel(f"{peer['host']}:{peer['port'] + self.port_offset}", options=GRPC_OPTIONS)
+        self.stubs[peer_id] = RaftStub(self.channels[peer_id])
+        self.next_index[peer_id] = len(self.log)
+        self.match_index[peer_id] = -1
+        self.probing[peer_id] = True
+        self.pipeline_epoch[peer_id] = 0
+        self.peer_ack_time[peer_id] = 0.0
+        self.replicate_events[peer_id] = asyncio.Event()
+        self.stream_retry_at[peer_id] = 0.0
+        if self.role == Role.LEADER:
+            self.replicators[peer_id] = asyncio.create_task(self.replicate_to(peer, self.current_term))
+
+    def remove_peer(self, peer_id: str) -> None:
+        """Stop replicating to a removed peer. Its progress is kept for replies still in flight and reset if it comes back."""
+        replicator = self.replicators.pop(peer_id, None)
+        if replicator:
+            replicator.cancel()
+        stream = self.streams.pop(peer_id, None)
+        if stream:
+            stream.close()
+        if self.owns_channels and peer_id in self.channels:
+            asyncio.create_task(self.channels.pop(peer_id).close())
+
+    async def change_membership(self, members: Dict[str, PeerNode], learners: Set[str]) -> None:
+        """
+        Replicate a new membership through the log and wait until it is applied.
+        Only one member is added, promoted or removed per change, and a change
+        waits for the previous one and for the leader's first entry of its term
+        to be applied, so the old and new majorities always overlap.
+        """
+        async with self.state_lock:
+            if self.role != Role.LEADER:
+                raise NotLeaderError("Not the leader")
+            if self.last_applied < max(self.term_start_index, self.config_index):
+                raise MembershipChangeError("Another membership change is in progress")
+
+            index = len(self.log)
+            config = self.membership_pb(members, learners, index)
+            self.log.append({"term": self.current_term, "command": "", "config": config.SerializeToString()})
+            self.config_index = index
+            waiter = asyncio.get_running_loop().create_future()
+            self.commit_waiters[index] = waiter
+            logger.info(f"Node {self.name} proposing membership at index {index}: {sorted(members)}, learners {sorted(learners)}")
+
+        await self.flush_log()
+        await waiter
+
+    async def add_server(self, member: PeerNode, rounds: int = 10) -> None:
+        """
+        Add a node to the group: it joins as a learner, catches up with the
+        log, and is promoted to voter once it keeps up (Raft thesis §4.2.1).
+        Re-running it for a learner that failed to catch up resumes the promotion.
+        A member with `learner` set stays a learner, i.e. a read replica.
+        """
+        learners = set(self.members) - self.voters
+        if member['id'] not in self.members:
+            await self.change_membership({**self.members, member['id']: member}, learners | {member['id']})
+        if member['id'] in self.voters or member.get('learner'):
+            return
+
+        # Each round waits until the learner holds the leader's log as of the
+        # round start; once a round is shorter than an election timeout, it is caught up.
+        for _ in range(rounds):
+            started = self.now()
+            target = len(self.log) - 1
+            while self.match_index.get(member['id'], -1) < target:
+                if self.role != Role.LEADER:
+                    raise NotLeaderError("Lost leadership while adding a member")
+                if self.now() - started > self.election_timeout * rounds:
+                    raise MembershipChangeError(f"Node {member['id']} is not catching up, it stays a learner")
+                await asyncio.sleep(self.heartbeat_interval)
+            if self.now() - started < self.election_timeout:
+                break
+        else:
+            raise MembershipChangeError(f"Node {member['id']} did not catch up in {rounds} rounds, it stays a learner")
+
+        await self.change_membership(self.members, set(self.members) - self.voters - {member['id']})
+
+    async def remove_server(self, node_id: str) -> None:
+        """Remove a node from the group. A leader removing itself steps down once the change is applied."""
+        if node_id not in self.members:
+            return
+        members = {peer_id: peer for peer_id, peer in self.members.items() if peer_id != node_id}
+        await self.change_membership(members, set(members) - self.voters)
 
     # --------------------------------------------------------------------------
     # Main loop: handle timeouts and incoming HTTP RPCs
@@ -317,58 +1241,114 @@ class RaftNode:
                 async with self.state_lock:
                     if (
                         self.role != Role.LEADER
+                        and self.node_id in self.voters
                         and current_time - self.last_heartbeat
                         > self.election_timeout
                     ):
-                        logger.info(f"Node {self.node_id} election timeout({current_time - self.last_heartbeat}, {self.election_timeout}), starting election")
+                        logger.info(f"Node {self.name} election timeout({current_time - self.last_heartbeat}, {self.election_timeout}), starting election")
                         should_start_election = True
 
                 if should_start_election:
                     await self.start_election()
                 await asyncio.sleep(self.election_timeout / 2) 
         except asyncio.CancelledError:
-            logger.info(f"Node {self.node_id} run loop cancelled")
+            logger.info(f"Node {self.name} run loop cancelled")
             await self.shutdown()
             raise
 
 
-    async def append_log_entry(self, command) -> None:
+    async def append_log_entry(self, command) -> Any:
+        """
+        Propose a command and wait until it is committed and applied. Returns
+        what the state machine returned when applying it.
+
+        Proposals are not appended one by one: they are queued and flushed in
+        batches (see flush_proposals), so concurrent commands share one log
+        append, one fsync and one AppendEntries round.
+        """
+        if self.role != Role.LEADER:
+            raise NotLeaderError("Not the leader")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.proposals.append((command, waiter))
+        if len(self.proposals) >= self.max_batch_size:
+            self.proposals_ready.set()
+        if self.batcher_task is None:
+            self.batcher_task = asyncio.create_task(self.flush_proposals())
+
+        result = await waiter
+        logger.info(f"Node {self.name} applied proposed log entry")
+        return result
+
+    async def flush_proposals(self) -> None:
+        """
+        Drain the proposal queue. Each batch collects commands for up to
+        batch_window seconds or until max_batch_size are queued; commands
+        arriving while a batch is being appended go into the next one.
+        """
+        try:
+            while self.proposals:
+                if self.batch_window > 0 and len(self.proposals) < self.max_batch_size:
+                    try:
+                        await asyncio.wait_for(self.proposals_ready.wait(), timeout=self.batch_window)
+                    except asyncio.TimeoutError:
+                        pass
+                self.proposals_ready.clear()
+                batch = self.proposals[:self.max_batch_size]
+                del self.proposals[:self.max_batch_size]
+                await self.append_batch(batch)
+        finally:
+            self.batcher_task = None
+
+    async def append_batch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Append a batch of proposals to the leader's log and register their commit waiters."""
+        # Callers that gave up before their command was appended are dropped.
+        batch = [(command, waiter) for command, waiter in batch if not waiter.done()]
+        if not batch:
+            return
+
         async with self.state_lock:
             if self.role != Role.LEADER:
-                raise Exception("Not the leader")
+                for _, waiter in batch:
+                    waiter.set_exception(NotLeaderError("Not the leader"))
+                return
 
-            self.log.append({"term": self.current_term, "command": command})
+            first_index = len(self.log)
+            self.log.extend([{"term": self.current_term, "command": command} for command, _ in batch])
+            for offset, (_, waiter) in enumerate(batch):
+                self.commit_waiters[first_index + offset] = waiter
 
-            new_index = len(self.log) - 1
-            self.last_applied = new_index
-        
-        total = len(self.peers) + 1  # +1 for self
-        majority = total // 2 + 1
-        while True:
-            async with self.state_lock:
-                count = 1
-                for idx in self.match_index.values():
-                    if idx >= new_index:
-                        count += 1
-                if count >= majority:
-                    self.commit_index = new_index
-                    logger.info(f"Node {self.node_id} committed log entry at index {new_index}")
-                    break
-                logger.info(f"Node {self.node_id} waiting for majority to commit log entry at index {new_index}, current count: {count}")
+        await self.flush_log()
 
-                if self.role != Role.LEADER:
-                    logger.info(f"Node {self.node_id} stepped down from leader while waiting for commit")
-                    return
-            await asyncio.sleep(0.5)
+    async def flush_log(self) -> None:
+        """Replicate freshly appended entries and count them once they are durable locally."""
+        # Followers receive the entries while the leader flushes its own copy.
+        self.trigger_replication()
+        await self.log.sync()
+        async with self.state_lock:
+            if self.role == Role.LEADER:
+                await self.advance_commit_index()
         
     async def shutdown(self) -> None:
         """Clean up resources, clos ing gRPC channels."""
-        logger.info(f"Node {self.node_id} shutting down")
+        logger.info(f"Node {self.name} shutting down")
         if self.heartbeat_task:
             self.heartbeat_task.cancel()
-        for channel in self.channels.values():
-            await channel.close()
-        logger.info(f"Node {self.node_id} shutdown complete")
+        if self.batcher_task:
+            self.batcher_task.cancel()
+        async with self.state_lock:
+            await self.become_follower(self.current_term)
+            for _, waiter in self.proposals:
+                if not waiter.done():
+                    waiter.set_exception(NotLeaderError(f"Node {self.name} is shutting down"))
+            self.proposals.clear()
+        for stream in self.streams.values():
+            stream.close()
+        if self.owns_channels:
+            for channel in self.channels.values():
+                await channel.close()
+        self.log.close()
+        logger.info(f"Node {self.name} shutdown complete")
 
 
 
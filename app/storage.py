@@ -0,0 +1,479 @@
+import abc
+import asyncio
+import bisect
+import json
+import logging
+import os
+import struct
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple, Union
+
+from app.commands import entry_to_pb, entry_from_pb
+from app.raft_grpc.raft_pb2 import LogEntry as PbLogEntry
+
+logger = logging.getLogger(__name__)
+
+# Every WAL record is: payload length (4 bytes) | crc32 of payload (4 bytes) | payload
+RECORD_HEADER = struct.Struct(">II")
+# The snapshot file starts with: last included index | last included term | crc32 of data
+SNAPSHOT_HEADER = struct.Struct(">qqI")
+SEGMENT_SUFFIX = ".log"
+STATE_FILE = "state.json"
+MEMBERSHIP_FILE = "membership.bin"
+SNAPSHOT_FILE = "snapshot.bin"
+
+
+class Snapshot(NamedTuple):
+    index: int
+    term: int
+    data: bytes
+
+
+class LogStore(abc.ABC):
+    """
+    Storage backend for a Raft node: the log itself, the latest snapshot, the
+    persistent `current_term` / `voted_for` pair and the last applied membership. Entries are dicts with `term`
+    and `command` keys and are addressed by absolute log index, list-style;
+    entries covered by the snapshot are no longer accessible.
+    """
+
+    def __init__(self):
+        self.entries: List[Dict] = []
+        self.offset: int = 0  # absolute index of entries[0]
+        self.snapshot: Optional[Snapshot] = None
+
+    def __len__(self) -> int:
+        return self.offset + len(self.entries)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            start = self.offset if index.start is None else index.start
+            stop = len(self) if index.stop is None else index.stop
+            if start < self.offset:
+                raise IndexError(f"log index {start} is compacted into the snapshot")
+            return self.entries[start - self.offset:max(stop - self.offset, 0)]
+
+        if index < 0:
+            index += len(self)
+        if index < self.offset:
+            raise IndexError(f"log index {index} is compacted into the snapshot")
+        return self.entries[index - self.offset]
+
+    @property
+    def snapshot_index(self) -> int:
+        return self.offset - 1
+
+    @property
+    def snapshot_term(self) -> int:
+        return self.snapshot.term if self.snapshot else 0
+
+    def term_at(self, index: int) -> int:
+        """Term of the entry at `index`, including the snapshot's last included entry."""
+        if index < 0:
+            return 0
+        if index == self.snapshot_index:
+            return self.snapshot_term
+        return self[index]["term"]
+
+    def last_term(self) -> int:
+        return self.term_at(len(self) - 1)
+
+    def first_index_of_term(self, term: int) -> int:
+        """First retained index holding `term`; terms never decrease along the log."""
+        return self.offset + bisect.bisect_left(self.entries, term, key=lambda e: e["term"])
+
+    def last_index_of_term(self, term: int) -> int:
+        """Last retained index holding `term`, or -1 if no retained entry has it."""
+        index = self.offset + bisect.bisect_right(self.entries, term, key=lambda e: e["term"]) - 1
+        if index < self.offset or self.entries[index - self.offset]["term"] != term:
+            return -1
+        return index
+
+    @property
+    @abc.abstractmethod
+    def durable_index(self) -> int:
+        """Index of the last entry known to be on stable storage."""
+
+    def append(self, entry: Dict) -> None:
+        self.extend([entry])
+
+    @abc.abstractmethod
+    def extend(self, entries: List[Dict]) -> None:
+        ...
+
+    @abc.abstractmethod
+    def truncate(self, index: int) -> None:
+        """Drop the entry at `index` and everything after it."""
+
+    @abc.abstractmethod
+    async def sync(self) -> None:
+        """Make every appended entry durable."""
+
+    @abc.abstractmethod
+    def write_snapshot(self, snapshot: Snapshot) -> None:
+        """Persist a snapshot. Safe to run in a worker thread; does not touch the log."""
+
+    def compact(self, snapshot: Snapshot) -> None:
+        """
+        Make `snapshot` the new base of the log. Entries it covers are dropped;
+        if our entry at its index disagrees on the term the whole log is discarded.
+        """
+        if snapshot.index <= self.snapshot_index:
+            return
+        if snapshot.index < len(self) and self.term_at(snapshot.index) == snapshot.term:
+            self.drop_prefix(snapshot.index + 1)
+        else:
+            self.reset(snapshot.index + 1)
+        self.snapshot = snapshot
+
+    @abc.abstractmethod
+    def drop_prefix(self, index: int) -> None:
+        """Forget every entry before `index`."""
+
+    @abc.abstractmethod
+    def reset(self, index: int) -> None:
+        """Forget every entry; the next appended entry gets `index`."""
+
+    @abc.abstractmethod
+    def load_state(self) -> Tuple[int, Optional[str]]:
+        ...
+
+    @abc.abstractmethod
+    async def save_state(self, term: int, voted_for: Optional[str]) -> None:
+        """Persist term and vote; async so a backend can fsync off the event loop."""
+
+    @abc.abstractmethod
+    def load_membership(self) -> Optional[bytes]:
+        """The serialized Membership last saved, or None to use the configured cluster."""
+
+    @abc.abstractmethod
+    async def save_membership(self, data: bytes) -> None:
+        """Persist a serialized Membership, see save_state."""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryLogStore(LogStore):
+    """Volatile backend; everything is lost on restart. Useful for tests and throwaway nodes."""
+
+    def __init__(self):
+        super().__init__()
+        self.state: Tuple[int, Optional[str]] = (0, None)
+        self.membership: Optional[bytes] = None
+
+    @property
+    def durable_index(self) -> int:
+        return len(self) - 1
+
+    def extend(self, entries: List[Dict]) -> None:
+        self.entries.extend(entries)
+
+    def truncate(self, index: int) -> None:
+        del self.entries[index - self.offset:]
+
+    async def sync(self) -> None:
+        return
+
+    def write_snapshot(self, snapshot: Snapshot) -> None:
+        return
+
+    def drop_prefix(self, index: int) -> None:
+        del self.entries[:index - self.offset]
+        self.offset = index
+
+    def reset(self, index: int) -> None:
+        self.entries = []
+        self.offset = index
+
+    def load_state(self) -> Tuple[int, Optional[str]]:
+        return self.state
+
+    async def save_state(self, term: int, voted_for: Optional[str]) -> None:
+        self.state = (term, voted_for)
+
+    def load_membership(self) -> Optional[bytes]:
+        return self.membership
+
+    async def save_membership(self, data: bytes) -> None:
+        self.membership = data
+
+
+class FileLogStore(LogStore):
+    """
+    Append-only segmented write-ahead log.
+
+    Records are appended to the active segment without flushing; `sync()`
+    fsyncs once for everything written so far, so concurrent callers share a
+    single fsync (group commit). Each record carries a CRC32 and a torn or
+    corrupt tail is cut off when the log is loaded. Segments that are fully
+    covered by the snapshot are deleted. Entries are also kept in memory so
+    reads never touch the disk.
+    """
+
+    def __init__(self, data_dir: str, segment_size: int = 64 * 1024 * 1024):
+        super().__init__()
+        self.data_dir = data_dir
+        self.segment_size = segment_size
+        os.makedirs(data_dir, exist_ok=True)
+
+        # Per entry: (first index of its segment, byte offset inside the segment)
+        self.positions: List[Tuple[int, int]] = []
+        self.segments: List[int] = []
+
+        self.active = None
+        self.active_size = 0
+
+        # Group commit bookkeeping: appends bump `written`, a finished fsync
+        # publishes how far it covered unless a truncate intervened.
+        self.written = 0
+        self.synced = 0
+        self.durable_length = 0
+        self.truncations = 0
+        self.sync_lock = asyncio.Lock()
+
+        self.load()
+
+    # --------------------------------------------------------------------------
+    # Loading
+    # --------------------------------------------------------------------------
+
+    def segment_path(self, first_index: int) -> str:
+        return os.path.join(self.data_dir, f"{first_index:020d}{SEGMENT_SUFFIX}")
+
+    def load(self) -> None:
+        """Read the snapshot and all segments sequentially, stopping at the first damaged record."""
+        self.snapshot = self.load_snapshot()
+        start = self.snapshot.index + 1 if self.snapshot else 0
+
+        names = sorted(n for n in os.listdir(self.data_dir) if n.endswith(SEGMENT_SUFFIX))
+        damaged = False
+        for name in names:
+            first_index = int(name[:-len(SEGMENT_SUFFIX)])
+            path = os.path.join(self.data_dir, name)
+            if damaged or (self.segments and first_index != len(self)):
+                logger.warning(f"Discarding WAL segment {path} after a gap or damaged record")
+                os.remove(path)
+                continue
+            if not self.segments:
+                self.offset = first_index
+
+            with open(path, "rb") as f:
+                data = f.read()
+
+            offset = 0
+            self.segments.append(first_index)
+            while offset < len(data):
+                if offset + RECORD_HEADER.size > len(data):
+                    damaged = True
+                    break
+                length, crc = RECORD_HEADER.unpack_from(data, offset)
+                payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    damaged = True
+                    break
+                self.entries.append(entry_from_pb(PbLogEntry.FromString(payload)))
+                self.positions.append((first_index, offset))
+                offset += RECORD_HEADER.size + length
+
+            if damaged:
+                logger.warning(f"Truncating damaged WAL tail in {path} at offset {offset}")
+                with open(path, "r+b") as f:
+                    f.truncate(offset)
+                    f.flush()
+                    os.fsync(f.fileno())
+
+        if not self.segments:
+            self.offset = start
+            self.segments.append(start)
+        self.open_active(self.segments[-1])
+        self.durable_length = len(self)
+
+        if self.offset > start or len(self) < start:
+            # The log does not connect to the snapshot; only the snapshot is usable.
+            self.reset(start)
+        elif start > self.offset:
+            self.drop_prefix(start)
+        logger.info(f"Loaded snapshot up to {self.snapshot_index} and {len(self.entries)} WAL entries from {self.data_dir}")
+
+    def load_snapshot(self) -> Optional[Snapshot]:
+        path = os.path.join(self.data_dir, SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            data = f.read()
+        index, term, crc = SNAPSHOT_HEADER.unpack_from(data, 0)
+        payload = data[SNAPSHOT_HEADER.size:]
+        if zlib.crc32(payload) != crc:
+            logger.warning(f"Ignoring damaged snapshot {path}")
+            return None
+        return Snapshot(index, term, payload)
+
+    def open_active(self, first_index: int) -> None:
+        path = self.segment_path(first_index)
+        self.active = open(path, "ab")
+        self.active_size = self.active.tell()
+
+    def fsync_dir(self) -> None:
+        fd = os.open(self.data_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def replace_file(self, name: str, data: bytes) -> None:
+        """Atomically replace `name` in the data directory: write a temp file, fsync, rename."""
+        path = os.path.join(self.data_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self.fsync_dir()
+
+    # --------------------------------------------------------------------------
+    # Log access
+    # --------------------------------------------------------------------------
+
+    @property
+    def durable_index(self) -> int:
+        return self.durable_length - 1
+
+    def roll_segment(self) -> None:
+        """Seal the active segment and start a new one at the next index."""
+        self.active.flush()
+        os.fsync(self.active.fileno())
+        self.active.close()
+        first_index = len(self)
+        self.segments.append(first_index)
+        self.open_active(first_index)
+        self.fsync_dir()
+
+    def extend(self, entries: List[Dict]) -> None:
+        for entry in entries:
+            if self.active_size >= self.segment_size and self.positions and self.positions[-1][0] == self.segments[-1]:
+                self.roll_segment()
+            payload = entry_to_pb(entry).SerializeToString()
+            self.active.write(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)))
+            self.active.write(payload)
+            self.positions.append((self.segments[-1], self.active_size))
+            self.active_size += RECORD_HEADER.size + len(payload)
+            self.entries.append(entry)
+        self.written += len(entries)
+
+    def truncate(self, index: int) -> None:
+        if index >= len(self):
+            return
+        segment, offset = self.positions[index - self.offset]
+
+        self.active.close()
+        stale = [s for s in self.segments if s > segment]
+        for first_index in stale:
+            os.remove(self.segment_path(first_index))
+            self.segments.remove(first_index)
+        if stale:
+            self.fsync_dir()
+        with open(self.segment_path(segment), "r+b") as f:
+            f.truncate(offset)
+        self.open_active(segment)
+
+        del self.entries[index - self.offset:]
+        del self.positions[index - self.offset:]
+        self.durable_length = min(self.durable_length, index)
+        self.truncations += 1
+        self.written += 1
+
+    async def sync(self) -> None:
+        target = self.written
+        if self.synced >= target:
+            return
+        async with self.sync_lock:
+            if self.synced >= target:
+                return
+            # Everything written up to here rides along with this fsync.
+            target = self.written
+            length = len(self)
+            truncations = self.truncations
+            self.active.flush()
+            # fsync a duplicate descriptor so a concurrent truncate/roll may close the segment.
+            fd = os.dup(self.active.fileno())
+            try:
+                await asyncio.to_thread(os.fsync, fd)
+            finally:
+                os.close(fd)
+            self.synced = target
+            if truncations == self.truncations:
+                self.durable_length = max(self.durable_length, length)
+
+    # --------------------------------------------------------------------------
+    # Snapshots & compaction
+    # --------------------------------------------------------------------------
+
+    def write_snapshot(self, snapshot: Snapshot) -> None:
+        header = SNAPSHOT_HEADER.pack(snapshot.index, snapshot.term, zlib.crc32(snapshot.data))
+        self.replace_file(SNAPSHOT_FILE, header + snapshot.data)
+
+    def drop_prefix(self, index: int) -> None:
+        del self.entries[:index - self.offset]
+        del self.positions[:index - self.offset]
+        self.offset = index
+        self.durable_length = max(self.durable_length, index)
+
+        # A segment can go once the next one starts at or before the new offset.
+        covered = [s for s, nxt in zip(self.segments, self.segments[1:]) if nxt <= index]
+        for first_index in covered:
+            os.remove(self.segment_path(first_index))
+            self.segments.remove(first_index)
+        if covered:
+            self.fsync_dir()
+
+    def reset(self, index: int) -> None:
+        self.active.close()
+        for first_index in self.segments:
+            os.remove(self.segment_path(first_index))
+        self.segments = [index]
+        self.open_active(index)
+        self.fsync_dir()
+
+        self.entries = []
+        self.positions = []
+        self.offset = index
+        self.durable_length = index
+        self.truncations += 1
+
+    # --------------------------------------------------------------------------
+    # Term / vote
+    # --------------------------------------------------------------------------
+
+    def load_state(self) -> Tuple[int, Optional[str]]:
+        path = os.path.join(self.data_dir, STATE_FILE)
+        if not os.path.exists(path):
+            return 0, None
+        with open(path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        return state["term"], state["voted_for"]
+
+    async def save_state(self, term: int, voted_for: Optional[str]) -> None:
+        """Term and vote share one file, so they are always replaced together."""
+        await asyncio.to_thread(self.replace_file, STATE_FILE, json.dumps({"term": term, "voted_for": voted_for}).encode("utf-8"))
+
+    # --------------------------------------------------------------------------
+    # Membership
+    # --------------------------------------------------------------------------
+
+    def load_membership(self) -> Optional[bytes]:
+        path = os.path.join(self.data_dir, MEMBERSHIP_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def save_membership(self, data: bytes) -> None:
+        await asyncio.to_thread(self.replace_file, MEMBERSHIP_FILE, data)
+
+    def close(self) -> None:
+        if self.active and not self.active.closed:
+            self.active.flush()
+            os.fsync(self.active.fileno())
+            self.active.close()
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+import httpx
+from fastapi import HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response
+from websockets.asyncio.client import ClientConnection
+from websockets.exceptions import ConnectionClosed
+
+from app.raftnode import RaftNode
+
+logger = logging.getLogger(__name__)
+
+# Hop-by-hop headers, and headers httpx recomputes for the forwarded body.
+SKIP_HEADERS = {"host", "connection", "keep-alive", "transfer-encoding", "upgrade", "content-length", "content-encoding"}
+# Marks a request a follower forwarded, so a node that lost leadership meanwhile
+# answers NOT_LEADER_HEADER instead of forwarding it again.
+FORWARDED_HEADER = "x-raft-forwarded"
+NOT_LEADER_HEADER = "x-raft-not-leader"
+
+# Persistent connection pool per leader address.
+leader_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def forward_headers(headers) -> Dict[str, str]:
+    return {key: value for key, value in headers.items() if key.lower() not in SKIP_HEADERS}
+
+
+async def forward_http(client: httpx.AsyncClient, request: Request, body: bytes, headers: Optional[Dict[str, str]] = None, timeout=httpx.USE_CLIENT_DEFAULT) -> Response:
+    """Send `request` through `client` and turn the reply into a response for the caller."""
+    reply = await client.request(
+        request.method,
+        request.url.path,
+        params=request.query_params,
+        headers={**forward_headers(request.headers), **(headers or {})},
+        content=body,
+        timeout=timeout,
+    )
+    return Response(reply.content, status_code=reply.status_code, headers=forward_headers(reply.headers))
+
+
+async def relay_websocket(websocket: WebSocket, upstream: ClientConnection, backlog: List[Union[str, bytes]]) -> bool:
+    """
+    Pump frames both ways between an accepted client WebSocket and an upstream
+    connection until one side closes. A client frame the upstream could not
+    take stays in `backlog` for the next upstream. Returns True once the
+    client has gone away, False when the upstream closed.
+    """
+    async def client_to_upstream() -> bool:
+        while True:
+            if not backlog:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return True
+                backlog.append(message["text"] if message.get("text") is not None else message["bytes"])
+            try:
+                await upstream.send(backlog[0])
+            except ConnectionClosed:
+                return False
+            backlog.pop(0)
+
+    async def upstream_to_client() -> bool:
+        try:
+            async for message in upstream:
+                if isinstance(message, str):
+                    await websocket.send_text(message)
+                else:
+                    await websocket.send_bytes(message)
+        except ConnectionClosed:
+            pass
+        except (WebSocketDisconnect, RuntimeError):
+            return True
+        return False
+
+    tasks = [asyncio.create_task(client_to_upstream()), asyncio.create_task(upstream_to_client())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        return any(task.result() for task in done)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def leader_server(raft_node: RaftNode, leader_id: str) -> Optional[str]:
+    """HTTP address of a group member, from the group's current membership."""
+    member = raft_node.members.get(leader_id)
+    return member["server"] if member else None
+
+
+async def call_leader(nodes: List[RaftNode], send: Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]) -> Optional[httpx.Response]:
+    """
+    Make a request to the leader of `nodes` with `send`, over a pooled
+    connection. Returns None when this node is such a leader and should handle
+    it. Elections are waited out, so a failover does not surface to the client,
+    but a leader failing mid-request raises HTTPException(503).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + max(node.election_timeout for node in nodes) * 2
+    while True:
+        if any(node.is_leader() for node in nodes):
+            return None
+        try:
+            node = next((node for node in nodes if node.leadership.leader_id), nodes[0])
+            leader_id = node.leadership.leader_id
+            if leader_id is None:
+                leader_id = await node.wait_for_leader(max(deadline - loop.time(), 0))
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="No leader node available")
+
+        server = leader_server(node, leader_id)
+        if server is None:
+            raise HTTPException(status_code=503, detail="Leader node not found in cluster")
+        if server not in leader_clients:
+            leader_clients[server] = httpx.AsyncClient(base_url=f"http://{server}", timeout=nodes[0].rpc_timeout * 5)
+
+        try:
+            reply = await send(leader_clients[server])
+            if NOT_LEADER_HEADER not in reply.headers:
+                return reply
+        except httpx.ConnectError as e:
+            # Nothing was sent, so trying the next leader cannot apply the command twice.
+            logger.info(f"Leader {leader_id} unreachable: {e}")
+        except (httpx.HTTPError, asyncio.TimeoutError) as e:
+            # The leader may have applied the command before failing: not retried.
+            logger.warning(f"Leader {leader_id} failed to answer: {e!r}")
+            raise HTTPException(status_code=503, detail="Leader node failed, please try again.")
+
+        if loop.time() >= deadline:
+            raise HTTPException(status_code=503, detail="No leader node available")
+        await asyncio.sleep(nodes[0].heartbeat_interval)
+
+
+async def forward_to_leader(request: Request, nodes: List[RaftNode], body: Optional[bytes] = None) -> Optional[Response]:
+    """
+    Relay a write to the leader of `nodes` (the Raft group of the game, or every
+    local group for new games) and return its reply, sending `body` instead of
+    the request's own if given. Returns None when this node is such a leader
+    and should handle the request.
+    """
+    if not nodes or any(node.is_leader() for node in nodes):
+        return None
+    if request.headers.get(FORWARDED_HEADER):
+        # Forwarded on a stale hint: let the sending follower find the new leader.
+        raise HTTPException(status_code=503, detail="Not the leader node", headers={NOT_LEADER_HEADER: "1"})
+
+    if body is None:
+        body = await request.body()
+    reply = await call_leader(nodes, lambda client: client.request(
+        request.method,
+        request.url.path,
+        params=request.query_params,
+        headers={**forward_headers(request.headers), FORWARDED_HEADER: "1"},
+        content=body,
+    ))
+    if reply is None:
+        return None
+    return Response(reply.content, status_code=reply.status_code, headers=forward_headers(reply.headers))
+
+
+async def forward_action(raft_node: Optional[RaftNode], code: str, token: str, action: Dict) -> Optional[httpx.Response]:
+    """
+    Send a player's WebSocket action to the leader of the game's group, on the
+    player's behalf. Returns None when this node is the leader and should run it.
+    """
+    if raft_node is None:
+        return None
+    return await call_leader([raft_node], lambda client: client.post(
+        f"/game/{code}/actions",
+        json=action,
+        headers={"authorization": f"Bearer {token}", FORWARDED_HEADER: "1"},
+    ))
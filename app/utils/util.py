@@ -1,7 +1,9 @@
 import yaml
+import asyncio
 import logging
-from fastapi import WebSocket, WebSocketException
-from app.ws_error_codes import WebSocketError
+from fastapi import HTTPException, Request
+from typing import List, Optional
+from app.raftnode import NotLeaderError
 
 logger = logging.getLogger(__name__)
 
@@ -16,16 +18,35 @@ def load_yaml(file_path):
         return yaml.safe_load(file)
     
 
-async def ensure_raft_leader(websocket: WebSocket) -> bool:
-    raft_node = websocket.app.state.raft_node
-    
-    if raft_node and await raft_node.is_leader():
-        return True
-    
-    logger.warning("Raft node is not the leader, closing WebSocket connection.")
-    raise WebSocketException(code=WebSocketError.SERVICE_UNAVAILABLE.code, reason=WebSocketError.SERVICE_UNAVAILABLE.reason)
+def group_node(app, code: str):
+    """The local RaftNode of the group owning `code`, or None before startup."""
+    from app.raft import group_of # avoid a circular import
+    return app.state.raft_groups.get(group_of(code))
+
+
+def group_nodes(app, code: Optional[str] = None) -> List:
+    """RaftNodes a write may be handled by: the game's group, or any local group for new games."""
+    if code:
+        return [group_node(app, code)]
+    return list(app.state.raft_groups.values())
+
+
+async def ensure_consistent_read(request: Request) -> None:
+    """
+    Block a read until this node has applied everything committed before it arrived,
+    so GET requests can be served by any node without returning stale state.
+    """
+    raft_node = group_node(request.app, request.path_params["code"])
+    if not raft_node:
+        return
+
+    try:
+        await raft_node.read_barrier()
+    except (NotLeaderError, asyncio.TimeoutError) as e:
+        logger.warning(f"Consistent read failed: {e}")
+        raise HTTPException(status_code=503, detail="Cluster unavailable, please try later.")
 
 
 def ensure_player_in_game(game, player_id: str) -> bool:
-    if not any(player.id == player_id for player in game.players):
+    if game.seat_of(player_id) < 0:
         raise ValueError("Player not in game")
\ No newline at end of file
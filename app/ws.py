@@ -1,44 +1,255 @@
+import time
+import asyncio
 import logging
+import functools
+from collections import OrderedDict, deque
+import orjson
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from typing import Callable, Deque, Dict, List, Optional, Tuple
 from app.utils.jwt import verify_token
 from app.manager import game_manager
+from app.ws_error_codes import WebSocketError
 
 logger = logging.getLogger(__name__)
 
+# Messages queued per connection before the slow-consumer policy kicks in.
+SEND_QUEUE_SIZE = 64
+# Seconds a connection's queue may stay full before the connection is dropped.
+SLOW_CLIENT_TIMEOUT = 5.0
+# Seconds to wait for the close handshake of a dropped connection.
+CLOSE_TIMEOUT = 1.0
+# Messages a snapshot of the game does not stand in for, so a full queue never drops them.
+PRESERVED_TYPES = {"win", "error"}
+# Broadcasts kept per game, replayed to clients that reconnect with the last version they saw.
+HISTORY_SIZE = 64
+# Games whose history is kept after their last connection here closed, for it to reconnect.
+DETACHED_HISTORIES = 256
+
+
+def encode_message(message: dict) -> str:
+    """JSON text frame for a message, encoded once however many clients receive it."""
+    return orjson.dumps(message).decode()
+
+
+class Connection:
+    """A client WebSocket with a bounded outbound queue, drained by its own writer task."""
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        # (message type, encoded frame)
+        self.queue: Deque[Tuple[str, str]] = deque()
+        self.ready = asyncio.Event()
+        # Close code and reason to send once the queue is drained.
+        self.closing: Optional[Tuple[int, str]] = None
+        self.full_since: Optional[float] = None
+        self.dropped = 0
+        self.writer = asyncio.create_task(self.write())
+
+    @property
+    def closed(self) -> bool:
+        return self.writer.done()
+
+    def send(self, kind: str, frame: str, snapshot: Callable[[], Optional[str]]) -> bool:
+        """
+        Queue an encoded message without waiting. When the queue is full, the
+        queued messages (but PRESERVED_TYPES) and this one are replaced by one
+        `snapshot()` of the game. Returns False when the client stayed full for too long.
+        """
+        if len(self.queue) >= SEND_QUEUE_SIZE:
+            now = time.monotonic()
+            if self.full_since is None:
+                self.full_since = now
+            elif now - self.full_since > SLOW_CLIENT_TIMEOUT:
+                return False
+            return self.resync(kind, frame, snapshot())
+        self.queue.append((kind, frame))
+        self.ready.set()
+        return True
+
+    def resync(self, kind: str, frame: str, snapshot: Optional[str]) -> bool:
+        """Replace the queue with a snapshot of the game, which reflects every message it replaces."""
+        kept = [queued for queued in self.queue if queued[0] in PRESERVED_TYPES]
+        if kind in PRESERVED_TYPES or snapshot is None:
+            kept.append((kind, frame))
+        self.dropped += len(self.queue) + 1 - len(kept)
+        self.queue.clear()
+        if snapshot is not None:
+            self.queue.append(("snapshot", snapshot))
+        self.queue.extend(kept)
+        self.ready.set()
+        return True
+
+    def close_when_drained(self, code: int, reason: str) -> None:
+        self.closing = (code, reason)
+        self.ready.set()
+
+    async def write(self) -> None:
+        try:
+            while True:
+                if not self.queue:
+                    self.full_since = None
+                    if self.closing is not None:
+                        await self.websocket.close(code=self.closing[0], reason=self.closing[1])
+                        return
+                    self.ready.clear()
+                    await self.ready.wait()
+                    continue
+                await self.websocket.send_text(self.queue.popleft()[1])
+        except Exception as e:
+            logger.error(f"Error sending message to connection {self.websocket}: {e}")
+
+    async def abort(self, code: int, reason: str) -> None:
+        """Stop writing and close the connection without flushing its queue."""
+        self.writer.cancel()
+        self.queue.clear()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code, reason=reason), CLOSE_TIMEOUT)
+        except Exception:
+            pass
+
+
+class History:
+    """
+    Recent broadcasts of a game as (version, type, frame), complete for every
+    version from `floor` on.
+    """
+    def __init__(self, floor: int):
+        self.floor = floor
+        self.frames: Deque[Tuple[int, str, str]] = deque()
+
+    def append(self, version: int, kind: str, frame: str) -> None:
+        if len(self.frames) >= HISTORY_SIZE:
+            self.floor = self.frames.popleft()[0] + 1
+        self.frames.append((version, kind, frame))
+
+    def since(self, version: int) -> Optional[List[Tuple[str, str]]]:
+        """Broadcasts tagged `version` or later, None if some are gone."""
+        if version < self.floor:
+            return None
+        return [(kind, frame) for tagged, kind, frame in self.frames if tagged >= version]
+
+
 class ConnectionManager:
+    """
+    WebSockets of the games on this node, leader or follower. Game events
+    reach them as the commands producing them are applied here, and are only
+    recorded for games with connections here now or recently.
+    """
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        self.active_connections: Dict[str, List[Connection]] = {}
+        self.history: Dict[str, History] = {}
+        # Games with a history but no connection left, least recently left first.
+        self.detached: OrderedDict[str, None] = OrderedDict()
 
     async def connect(self, code: str, websocket: WebSocket):
         #await websocket.accept()
-        self.active_connections.setdefault(code, []).append(websocket)
+        self.active_connections.setdefault(code, []).append(Connection(websocket))
+        self.detached.pop(code, None)
 
     def disconnect(self, code: str, websocket: WebSocket):
         connections = self.active_connections.get(code, [])
-        
-        if websocket in connections:
-            self.active_connections[code].remove(websocket)
-       
+        for connection in connections:
+            if connection.websocket is websocket:
+                connections.remove(connection)
+                connection.writer.cancel()
+                break
+
         if not connections:
             self.active_connections.pop(code, None)
+            if code in self.history:
+                self.detached[code] = None
+                while len(self.detached) > DETACHED_HISTORIES:
+                    self.history.pop(self.detached.popitem(last=False)[0], None)
 
-    async def broadcast(self, code: str, message: dict, skip_self: bool = False, sender: WebSocket = None):
+    def send(self, code: str, websocket: WebSocket, message: dict) -> None:
+        """Queue a message for one connection, behind the broadcasts already queued for it."""
         for connection in self.active_connections.get(code, []):
-            if skip_self and sender and connection == sender:
-                continue
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending message to connection {connection}: {e}")
-                self.disconnect(code, connection)
-
-    async def clear_game(self, code: str):
+            if connection.websocket is websocket:
+                self.enqueue(code, connection, message.get("type", ""), encode_message(message))
+                return
+
+    def snapshot_frame(self, code: str) -> Optional[str]:
+        """The game's current state as an encoded snapshot message, None once it is gone."""
+        try:
+            game = game_manager.get_game(code)
+        except ValueError:
+            return None
+        return encode_message({"type": "snapshot", "version": game.version, "game": game.to_dict()})
+
+    def enqueue(self, code: str, connection: Connection, kind: str, frame: str, snapshot: Optional[Callable[[], Optional[str]]] = None) -> None:
+        if connection.closed:
+            self.disconnect(code, connection.websocket)
+        elif not connection.send(kind, frame, snapshot or (lambda: self.snapshot_frame(code))):
+            logger.warning(f"Dropping slow connection {connection.websocket} of game {code} ({connection.dropped} messages dropped)")
+            self.disconnect(code, connection.websocket)
+            error = WebSocketError.SLOW_CONSUMER
+            asyncio.create_task(connection.abort(error.code, error.reason))
+
+    def resume(self, code: str, websocket: WebSocket, version: int) -> None:
+        """
+        Queue what a reconnecting client missed since `version` (inclusive, as
+        events are idempotent), or a snapshot of the game if that is no longer known.
+        """
+        history = self.history.get(code)
+        frames = history.since(version) if history else None
+        if frames is None:
+            snapshot = self.snapshot_frame(code)
+            frames = [("snapshot", snapshot)] if snapshot is not None else []
+        for connection in self.active_connections.get(code, []):
+            if connection.websocket is websocket:
+                for kind, frame in frames:
+                    self.enqueue(code, connection, kind, frame)
+                return
+
+    def drop_history(self, code: str) -> None:
+        self.history.pop(code, None)
+        self.detached.pop(code, None)
+
+    def record(self, code: str, version: int, kind: str, frame: str) -> None:
+        history = self.history.get(code)
+        if history is None:
+            history = self.history[code] = History(version)
+        history.append(version, kind, frame)
+
+    def broadcast(self, code: str, message: dict):
+        """Tag a message with the game's version, record it and queue it for every connection; never waits on a client."""
+        if code not in self.active_connections and code not in self.history:
+            # Nobody connected here, now or recently: a client connecting later starts from a snapshot.
+            return
+        try:
+            version = game_manager.get_game(code).version
+        except ValueError:
+            version = None
+        if version is not None:
+            message = {**message, "version": version}
+        kind, frame = message.get("type", ""), encode_message(message)
+        if version is not None:
+            self.record(code, version, kind, frame)
+        # Encoded at most once, for the connections that overflow.
+        snapshot = functools.cache(lambda: self.snapshot_frame(code))
+        for connection in list(self.active_connections.get(code, [])):
+            self.enqueue(code, connection, kind, frame, snapshot)
+
+    def on_game_event(self, code: str, event: Optional[dict]) -> None:
+        """GameManager listener: fan an applied event out to the game's connections."""
+        if event is not None:
+            self.broadcast(code, event)
+            return
+        # The game was removed, or replaced by a snapshot: its history no longer applies.
+        self.drop_history(code)
+        try:
+            game = game_manager.get_game(code)
+        except ValueError:
+            self.clear_game(code)
+            return
+        if code in self.active_connections:
+            self.broadcast(code, {"type": "snapshot", "game": game.to_dict()})
+
+    def clear_game(self, code: str):
+        """Close the game's connections once the messages queued for them are sent."""
+        self.drop_history(code)
         connections = self.active_connections.pop(code, [])
         for connection in connections:
-            try:
-                await connection.close(code=1000, reason="Game Over.")
-            except Exception:
-                pass
+            connection.close_when_drained(1000, "Game Over.")
 
-ws_manager = ConnectionManager()
\ No newline at end of file
+ws_manager = ConnectionManager()
+game_manager.subscribe(ws_manager.on_game_event)
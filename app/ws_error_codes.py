@@ -6,6 +6,7 @@ class WebSocketError(Enum):
     GAME_NOT_FOUND = (1003, "Game not found.")
     INTERNAL_ERROR = (1500, "Internal server error.")
     GAME_ERROR = (1501, "_")
+    SLOW_CONSUMER = (1502, "Connection too slow, please reconnect.")
 
     @property
     def code(self) -> int:
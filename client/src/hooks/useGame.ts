@@ -13,6 +13,7 @@ export interface ApiGame {
   current_turn: number;
   pending_roll: number | null;
   positions: Record<string, number[]>;
+  version?: number;
 }
 
 export function useGame(
@@ -42,7 +43,11 @@ export function useGame(
       };
     }, {})
   );
+  const [players, setPlayers] = useState<PlayerInfo[]>(game.players);
+  const [started, setStarted] = useState<boolean>(game.started);
   const wsRef = useRef<ReconnectingWebSocketController>(null);
+  // Last game version seen; a reconnect asks the server for what came after it.
+  const versionRef = useRef<number | null>(game.version ?? null);
 
   const send = useCallback((payload: any) => {
     wsRef.current?.socket?.send(JSON.stringify(payload));
@@ -64,15 +69,41 @@ export function useGame(
 
   useEffect(() => {
     // Open WebSocket with sub-protocol=token
+    const url = `${import.meta.env.VITE_APP_WS_URL}/game/${code}`;
     const ws = createAutoReconnectingWebSocket(
-      `${import.meta.env.VITE_APP_WS_URL}/game/${code}`,
+      () =>
+        versionRef.current === null
+          ? url
+          : `${url}?version=${versionRef.current}`,
       token,
       {
         reconnectInterval: 1000,
         maxRetries: 5,
         onMessage(event, ws) {
           const msg = JSON.parse(event.data);
+          if (typeof msg.version === "number") versionRef.current = msg.version;
           switch (msg.type) {
+            case "snapshot": {
+              // the server no longer has the events we missed
+              const turn: PlayerInfo | undefined =
+                msg.game.players[msg.game.current_turn];
+              setPlayers(msg.game.players);
+              setStarted(msg.game.started);
+              setPositions(msg.game.positions);
+              setCurrentTurn(turn ? turn.id : "");
+              setPendingRoll(
+                msg.game.players.reduce(
+                  (prev: Record<string, number | null>, curr: PlayerInfo, idx: number) => ({
+                    ...prev,
+                    [curr.id]:
+                      idx === msg.game.current_turn ? msg.game.pending_roll : null,
+                  }),
+                  {}
+                )
+              );
+              break;
+            }
+
             case "state":
               // full game state broadcast
               if (msg.positions) setPositions(msg.positions);
@@ -149,6 +180,8 @@ export function useGame(
   }, [code, token]);
 
   return {
+    players,
+    started,
     positions,
     currentTurn,
     pendingRoll,
@@ -4,13 +4,14 @@ import {
 } from "../types";
 
 export type AutoReconnectionWebSocket = (
-  url: string,
+  url: string | (() => string),
   token: string,
   options?: ReconnectingWebSocketOptions
 ) => ReconnectingWebSocketController;
 
 export default function createAutoReconnectingWebSocket(
-  url: string,
+  // A function is called again on every reconnect, e.g. to pass the last seen version.
+  url: string | (() => string),
   token: string,
   options: ReconnectingWebSocketOptions = {}
 ): ReconnectingWebSocketController {
@@ -29,7 +30,7 @@ export default function createAutoReconnectingWebSocket(
 
   function connect() {
     if (shouldStop || retries > maxRetries) return;
-    ws = new WebSocket(url, token);
+    ws = new WebSocket(typeof url === "function" ? url() : url, token);
 
     ws.addEventListener("open", (event) => {
       retries = 0; // reset on successful connect
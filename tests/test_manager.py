@@ -0,0 +1,125 @@
+import asyncio
+
+from app import raft
+from app.commands import encode_command
+from app.manager import GameManager
+from app.models import GameState
+
+
+class CommittingGroup:
+    """Stands in for a Raft group: commits every proposal once the proposer yields, like a real log."""
+    def __init__(self, manager: GameManager):
+        self.manager = manager
+
+    async def append_log_entry(self, command: bytes):
+        await asyncio.sleep(0)
+        return self.manager.apply_command(command)
+
+
+def make_manager(monkeypatch) -> GameManager:
+    manager = GameManager(group_id=0)
+    monkeypatch.setitem(raft.raft_groups, 0, CommittingGroup(manager))
+    return manager
+
+
+def apply(manager: GameManager, command: str, *args):
+    return manager.apply_command(encode_command(command, *args))
+
+
+def started_game(manager: GameManager, names=("ann", "bob")) -> GameState:
+    apply(manager, "create_game", "ABC123")
+    for name in names:
+        player_id = manager.name_to_uuid(name)
+        apply(manager, "join_game", "ABC123", {"id": player_id, "name": name, "is_online": True})
+    apply(manager, "start_game", "ABC123")
+    return manager.games["ABC123"]
+
+
+def test_move_token_captures_opponent():
+    game = GameState("ABC123")
+    game.add_player("a", "ann")
+    game.add_player("b", "bob")
+
+    assert not game.move_token(0, 0, 5)
+    assert game.move_token(1, 2, 5)
+    assert game.positions_of(0) == [-1, -1, -1, -1]
+    assert game.positions_of(1) == [-1, -1, 5, -1]
+
+    # Leaving a cell, also for the finish lane, frees it.
+    assert not game.move_token(1, 2, 6)
+    assert not game.move_token(0, 0, 5)
+    assert not game.move_token(1, 2, 41)
+    assert not game.move_token(0, 1, 6)
+    assert game.positions_of(1) == [-1, -1, 41, -1]
+
+
+def test_to_dict_round_trip_rebuilds_board():
+    game = GameState("ABC123")
+    game.add_player("a", "ann", online=True)
+    game.add_player("b", "bob")
+    game.started = True
+    game.current_turn = 1
+    game.pending_roll = 6
+    game.version = 7
+    game.move_token(0, 0, 12)
+    game.move_token(1, 3, 42)
+
+    restored = GameState.from_dict(game.to_dict())
+    assert restored.to_dict() == game.to_dict()
+    assert restored.to_model().players[0].is_online
+
+    # The board is rebuilt from the positions, so captures keep working.
+    assert restored.move_token(1, 0, 12)
+    assert restored.positions_of(0) == [-1, -1, -1, -1]
+
+
+def test_snapshot_restore_replaces_games():
+    manager = GameManager()
+    game = started_game(manager)
+    game.move_token(0, 1, 3)
+    apply(manager, "create_game", "OPEN01")
+    apply(manager, "join_game", "OPEN01", {"id": "c", "name": "cid"})
+    data = manager.snapshot()
+
+    replica = GameManager()
+    apply(replica, "create_game", "STALE1")
+    events = []
+    replica.listeners.append(lambda code, event: events.append((code, event)))
+    replica.restore(data)
+
+    assert set(replica.games) == {"ABC123", "OPEN01"}
+    assert replica.games["ABC123"].to_dict() == game.to_dict()
+    assert replica.find_available_game().code == "OPEN01"
+    # Connections of every game, gone or replaced, are told to resync.
+    assert sorted(events) == [("ABC123", None), ("OPEN01", None), ("STALE1", None)]
+
+
+def test_command_that_no_longer_applies_is_skipped():
+    manager = GameManager()
+    game = started_game(manager)
+    version = game.version
+
+    assert apply(manager, "start_game", "ABC123") is None
+    assert apply(manager, "join_game", "ABC123", {"id": "c", "name": "cid"}) is None
+    assert apply(manager, "move_piece", "ABC123", game.player_ids[0], 0, 0) is None
+    assert apply(manager, "roll_dice", "GONE00", 6, 0, 6, "a") is None
+    assert game.version == version
+
+
+def test_concurrent_rolls_apply_once(monkeypatch):
+    manager = make_manager(monkeypatch)
+    game = started_game(manager)
+    rolls = []
+    manager.listeners.append(lambda code, event: event and event["type"] == "roll" and rolls.append(event))
+
+    async def roll_twice():
+        # Two sockets of the player roll before either roll is committed.
+        return await asyncio.gather(
+            manager.roll_dice("ABC123", game.player_ids[0]),
+            manager.roll_dice("ABC123", game.player_ids[0]),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(roll_twice())
+    assert sum(isinstance(result, ValueError) for result in results) == 1
+    assert len(rolls) == 1
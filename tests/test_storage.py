@@ -0,0 +1,167 @@
+import asyncio
+import os
+
+import pytest
+
+from app.storage import FileLogStore, Snapshot, RECORD_HEADER, SEGMENT_SUFFIX, SNAPSHOT_FILE
+
+# Small enough that a handful of entries spans several segments.
+SEGMENT_SIZE = 64
+
+
+def make_entries(first: int, count: int, term: int = 1):
+    return [{"term": term, "command": f"cmd-{index}".encode()} for index in range(first, first + count)]
+
+
+def open_store(path, segment_size: int = SEGMENT_SIZE) -> FileLogStore:
+    return FileLogStore(str(path), segment_size=segment_size)
+
+
+def write(store: FileLogStore, entries) -> None:
+    store.extend(entries)
+    asyncio.run(store.sync())
+
+
+def segment_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(SEGMENT_SUFFIX))
+
+
+def last_segment(path) -> str:
+    return os.path.join(path, segment_files(path)[-1])
+
+
+def test_entries_survive_reload(tmp_path):
+    store = open_store(tmp_path)
+    entries = make_entries(0, 10)
+    write(store, entries)
+    assert store.durable_index == 9
+    store.close()
+
+    store = open_store(tmp_path)
+    assert len(segment_files(tmp_path)) > 1
+    assert len(store) == 10
+    assert store[0:10] == entries
+    assert store.durable_index == 9
+
+
+def test_torn_tail_is_cut_on_reload(tmp_path):
+    store = open_store(tmp_path, segment_size=1024)
+    write(store, make_entries(0, 5))
+    store.close()
+
+    # A record whose write was cut short: the header promises more than follows.
+    path = last_segment(tmp_path)
+    intact_size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(RECORD_HEADER.pack(100, 0) + b"partial")
+
+    store = open_store(tmp_path, segment_size=1024)
+    assert len(store) == 5
+    assert os.path.getsize(path) == intact_size
+
+    # The log keeps growing from the cut.
+    write(store, make_entries(5, 1))
+    store.close()
+    store = open_store(tmp_path, segment_size=1024)
+    assert store[0:6] == make_entries(0, 6)
+
+
+def test_corrupt_record_and_later_segments_are_dropped(tmp_path):
+    store = open_store(tmp_path)
+    write(store, make_entries(0, 12))
+    store.close()
+    names = segment_files(tmp_path)
+    assert len(names) > 2
+
+    # Flip the last byte of the second segment's first record.
+    path = os.path.join(tmp_path, names[1])
+    first_index = int(names[1][:-len(SEGMENT_SUFFIX)])
+    with open(path, "r+b") as f:
+        length, _ = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        f.seek(RECORD_HEADER.size + length - 1)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    store = open_store(tmp_path)
+    assert len(store) == first_index
+    assert store[0:first_index] == make_entries(0, first_index)
+    assert segment_files(tmp_path) == names[:2]
+
+
+def test_truncate_into_earlier_segment_then_reload(tmp_path):
+    store = open_store(tmp_path)
+    write(store, make_entries(0, 12))
+    segments = len(segment_files(tmp_path))
+
+    store.truncate(3)
+    assert len(store) == 3
+    assert store.durable_index == 2
+    assert len(segment_files(tmp_path)) < segments
+
+    # Entries of a newer term replace the truncated ones.
+    write(store, make_entries(3, 4, term=2))
+    assert store.durable_index == 6
+    store.close()
+
+    store = open_store(tmp_path)
+    assert len(store) == 7
+    assert store[0:7] == make_entries(0, 3) + make_entries(3, 4, term=2)
+    assert store.last_term() == 2
+
+
+def test_snapshot_compacts_covered_segments(tmp_path):
+    store = open_store(tmp_path)
+    write(store, make_entries(0, 20))
+    segments = segment_files(tmp_path)
+
+    snapshot = Snapshot(12, 1, b"state")
+    store.write_snapshot(snapshot)
+    store.compact(snapshot)
+    assert store.snapshot_index == 12
+    assert store.term_at(12) == 1
+    with pytest.raises(IndexError):
+        store[12]
+    assert store[13:20] == make_entries(13, 7)
+    assert len(segment_files(tmp_path)) < len(segments)
+    store.close()
+
+    store = open_store(tmp_path)
+    assert store.snapshot == snapshot
+    assert store.snapshot_index == 12
+    assert len(store) == 20
+    assert store[13:20] == make_entries(13, 7)
+
+
+def test_snapshot_beyond_log_resets_it(tmp_path):
+    store = open_store(tmp_path)
+    write(store, make_entries(0, 5))
+
+    # Installed from a leader: nothing of the local log connects to it.
+    snapshot = Snapshot(30, 3, b"state")
+    store.write_snapshot(snapshot)
+    store.compact(snapshot)
+    assert len(store) == 31
+    assert store.last_term() == 3
+
+    write(store, make_entries(31, 2, term=3))
+    store.close()
+
+    store = open_store(tmp_path)
+    assert store.snapshot_index == 30
+    assert store[31:33] == make_entries(31, 2, term=3)
+
+
+def test_damaged_snapshot_is_ignored(tmp_path):
+    store = open_store(tmp_path)
+    write(store, make_entries(0, 5))
+    store.write_snapshot(Snapshot(2, 1, b"state"))
+    store.close()
+
+    with open(os.path.join(tmp_path, SNAPSHOT_FILE), "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"?")
+
+    store = open_store(tmp_path)
+    assert store.snapshot is None
+    assert store[0:5] == make_entries(0, 5)
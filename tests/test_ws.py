@@ -0,0 +1,85 @@
+import asyncio
+
+from app.ws import Connection, History, HISTORY_SIZE, SEND_QUEUE_SIZE, SLOW_CLIENT_TIMEOUT
+
+
+class RecordingWebSocket:
+    """Collects the frames a Connection writes."""
+    def __init__(self):
+        self.frames = []
+
+    async def send_text(self, frame: str) -> None:
+        self.frames.append(frame)
+
+    async def close(self, code: int = 1000, reason: str = "") -> None:
+        pass
+
+
+def test_overflow_resyncs_with_snapshot_and_keeps_preserved():
+    async def scenario():
+        websocket = RecordingWebSocket()
+        connection = Connection(websocket)
+        # The writer task has not run yet: the queue fills up.
+        for index in range(SEND_QUEUE_SIZE - 1):
+            assert connection.send("move", f"move-{index}", lambda: "unused")
+        assert connection.send("error", "error-1", lambda: "unused")
+        assert connection.send("move", "move-last", lambda: "snapshot")
+        assert list(connection.queue) == [("snapshot", "snapshot"), ("error", "error-1")]
+        assert connection.dropped == SEND_QUEUE_SIZE
+
+        # Later messages queue behind the snapshot as usual.
+        assert connection.send("roll", "roll-1", lambda: "unused")
+        connection.close_when_drained(1000, "")
+        await connection.writer
+        return websocket.frames
+
+    assert asyncio.run(scenario()) == ["snapshot", "error-1", "roll-1"]
+
+
+def test_overflow_without_snapshot_keeps_message():
+    async def scenario():
+        connection = Connection(RecordingWebSocket())
+        for index in range(SEND_QUEUE_SIZE):
+            connection.send("move", f"move-{index}", lambda: None)
+        # The game is gone: nothing stands in for the dropped messages.
+        assert connection.send("move", "move-last", lambda: None)
+        assert list(connection.queue) == [("move", "move-last")]
+        connection.writer.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_client_full_for_too_long_is_dropped():
+    async def scenario():
+        connection = Connection(RecordingWebSocket())
+        for index in range(SEND_QUEUE_SIZE):
+            connection.send("move", f"move-{index}", lambda: "snapshot")
+        assert connection.send("move", "move-a", lambda: "snapshot")
+        connection.full_since -= SLOW_CLIENT_TIMEOUT + 1
+        connection.queue.extend([("move", "filler")] * SEND_QUEUE_SIZE)
+        assert not connection.send("move", "move-b", lambda: "snapshot")
+        connection.writer.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_history_resumes_from_version():
+    history = History(floor=3)
+    for version in range(3, 6):
+        history.append(version, "move", f"frame-{version}")
+
+    assert history.since(2) is None
+    assert history.since(4) == [("move", "frame-4"), ("move", "frame-5")]
+    assert history.since(6) == []
+
+
+def test_history_floor_rises_as_frames_are_dropped():
+    history = History(floor=0)
+    for version in range(HISTORY_SIZE + 2):
+        history.append(version, "move", f"frame-{version}")
+
+    assert history.floor == 2
+    assert history.since(1) is None
+    resumed = history.since(2)
+    assert len(resumed) == HISTORY_SIZE
+    assert resumed[0] == ("move", "frame-2")